@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+from parallel import imap_blocks
+
+SUMMARY_METRICS = ('Over_26_Wks', 'occupancy', 'cancellations')
+
+class _P2Quantiles:
+    """Jain & Chlamtac's P-squared estimator for several quantiles of many cells at once.
+
+    Five markers per (quantile, cell) track the running estimate, so memory is fixed no
+    matter how many observations arrive. Each add() takes one observation per cell.
+    """
+
+    def __init__(self, probs, n_cells):
+        p = np.asarray(probs, dtype=float)[:, None, None]
+        self.probs = p[:, 0, 0]
+        self.count = 0
+        self.q = np.zeros((len(self.probs), n_cells, 5))
+        self.n = np.broadcast_to(np.arange(5.0), self.q.shape).copy()
+        self.want = np.concatenate([0 * p, 2 * p, 4 * p, 2 + 2 * p, 4 + 0 * p], axis=-1)
+        self.step = np.concatenate([0 * p, p / 2, p, (1 + p) / 2, 1 + 0 * p], axis=-1)
+
+    def add(self, x):
+        x = np.asarray(x, dtype=float)
+        q, n = self.q, self.n
+        if self.count < 5:
+            q[:, :, self.count] = x
+            self.count += 1
+            if self.count == 5:
+                q.sort(axis=-1)
+            return
+        self.count += 1
+        np.minimum(q[:, :, 0], x, out=q[:, :, 0])
+        np.maximum(q[:, :, 4], x, out=q[:, :, 4])
+        # Markers to the right of the cell x fell into move up one position
+        k = (x[None, :, None] >= q[:, :, 1:4]).sum(axis=-1)
+        n += np.arange(5) > k[..., None]
+        self.want += self.step
+
+        for i in (1, 2, 3):
+            ni, nl, nr = n[..., i], n[..., i - 1], n[..., i + 1]
+            qi, ql, qr = q[..., i], q[..., i - 1], q[..., i + 1]
+            d = self.want[..., i] - ni
+            move = ((d >= 1) & (nr - ni > 1)) | ((d <= -1) & (nl - ni < -1))
+            if not move.any():
+                continue
+            s = np.sign(d) * move
+            # Piecewise-parabolic adjustment, falling back to linear if it would break ordering
+            par = qi + s / (nr - nl) * ((ni - nl + s) * (qr - qi) / (nr - ni) + (nr - ni - s) * (qi - ql) / (ni - nl))
+            lin = qi + s * (np.where(s > 0, qr, ql) - qi) / (np.where(s > 0, nr, nl) - ni)
+            q[..., i] = np.where(move, np.where((ql < par) & (par < qr), par, lin), qi)
+            n[..., i] += s
+
+    def values(self):
+        """(quantiles, cells) current estimates; exact while fewer than five observations."""
+        if self.count == 0:
+            return np.full(self.q.shape[:2], np.nan)
+        if self.count < 5:
+            return np.stack([np.quantile(self.q[i, :, :self.count], p, axis=-1) for i, p in enumerate(self.probs)])
+        return self.q[:, :, 2].copy()
+
+class StreamingSummary:
+    """Per-week Monte Carlo statistics updated replication by replication, keeping no runs.
+
+    Tracks mean and variance (Welford/Chan), P-squared quantiles and, for metrics given a
+    threshold, the probability of exceeding it. Memory depends only on weeks x metrics.
+    """
+
+    def __init__(self, weeks, metrics=SUMMARY_METRICS, quantiles=(0.05, 0.5, 0.95), thresholds=None):
+        self.weeks = weeks
+        self.metrics = list(metrics)
+        self.quantiles = quantiles
+        self.thresholds = {'Over_26_Wks': 0, 'cancellations': 0} if thresholds is None else thresholds
+        cells = (len(self.metrics), weeks)
+        self.n = 0
+        self.mean = np.zeros(cells)
+        self.m2 = np.zeros(cells)
+        self.breaches = np.zeros(cells)
+        self.limits = np.array([self.thresholds.get(m, np.inf) for m in self.metrics], dtype=float)[:, None]
+        self._p2 = _P2Quantiles(quantiles, len(self.metrics) * weeks)
+
+    def update(self, values):
+        """Adds a block of replications: values is (reps, metrics, weeks)."""
+        values = np.asarray(values, dtype=float)
+        b = len(values)
+        if b == 0:
+            return
+        # Chan's pairwise merge of the block's moments into the running ones
+        block_mean = values.mean(axis=0)
+        block_m2 = ((values - block_mean) ** 2).sum(axis=0)
+        total = self.n + b
+        delta = block_mean - self.mean
+        self.mean += delta * b / total
+        self.m2 += block_m2 + delta ** 2 * self.n * b / total
+        self.n = total
+        self.breaches += (values > self.limits).sum(axis=0)
+        for row in values.reshape(b, -1):
+            self._p2.add(row)
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.n - 1, 1))
+
+    def ci_halfwidth(self, metric, week, z=1.96):
+        """Normal-approximation confidence half-width of the mean of metric at week."""
+        if self.n < 2:
+            return np.inf
+        return z * self.std()[self.metrics.index(metric), week] / np.sqrt(self.n)
+
+    def to_frame(self):
+        """One row per week: <metric>_mean, _sd, _p<q> columns, and _breach where thresholded."""
+        df = pd.DataFrame({'week': np.arange(self.weeks)})
+        std = self.std()
+        qs = self._p2.values().reshape(len(self.quantiles), len(self.metrics), self.weeks)
+        for j, m in enumerate(self.metrics):
+            df[f'{m}_mean'] = self.mean[j]
+            df[f'{m}_sd'] = std[j]
+            for i, p in enumerate(self.quantiles):
+                df[f'{m}_p{round(p * 100)}'] = qs[i, j]
+            if m in self.thresholds:
+                df[f'{m}_breach'] = self.breaches[j] / max(self.n, 1)
+        df.attrs['n_reps'] = self.n
+        return df
+
+def stream_replications(params, current_ward, weeks=52, target_week=26, tol=0.5,
+                        metric='Over_26_Wks', batch_size=50, min_reps=100, max_reps=5000,
+                        seed=None, thresholds=None, on_batch=None, cancel=None, pool=None):
+    """Runs batches of replications into a StreamingSummary until the estimate is tight enough.
+
+    Stops once the 95% confidence half-width of the mean `metric` at target_week is at most
+    tol (after min_reps), or at max_reps. Batch i is driven by the i-th child of
+    SeedSequence(seed) and batches are summarized in order, so a given seed always stops
+    at the same point. With a process pool (parallel.replication_pool) the next batches run
+    on the other cores meanwhile. on_batch(summary) is called after every batch, and a set
+    `cancel` event stops the run early. Returns the summary.
+    """
+    if not 0 <= target_week < weeks:
+        raise ValueError(f"target_week {target_week} is outside the simulated weeks 0-{weeks - 1}")
+    summary = StreamingSummary(weeks, thresholds=thresholds)
+    sizes = [min(batch_size, max_reps - first) for first in range(0, max_reps, batch_size)]
+    batches = zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes)))
+    blocks = imap_blocks(params, current_ward, weeks, batches, summary.metrics, pool=pool)
+    try:
+        for block in blocks:
+            if cancel is not None and cancel.is_set():
+                break
+            summary.update(block)
+            if on_batch is not None:
+                on_batch(summary)
+            if summary.n >= min_reps and summary.ci_halfwidth(metric, target_week) <= tol:
+                break
+    finally:
+        blocks.close()
+    return summary
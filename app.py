@@ -1,25 +1,115 @@
+import os
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-from engine import run_simulation, find_ai_recommendation
+from engine import run_simulation, run_event_simulation
+from cache import ResultCache, cached_branches, cached_ai_recommendation, cache_key
+from aggregate import stream_replications
+from jobs import JobRunner
+from service import SimulationService, ServiceBusy
+from parallel import replication_pool
+from sweep import SweepStore, run_sweep, sensitivity_indices
+from surrogate import fluid_simulation
+from feed import WardFeed, WardForecaster, ward_profile
+from rare import breach_probability
 from visuals import (
     render_executive_kpis, 
     render_triple_charts, 
     render_ward_ops, 
     render_variance_analysis,
-    render_monte_carlo_cloud
+    render_monte_carlo_cloud,
+    render_performance_profile,
+    render_sensitivity
 )
 
 st.set_page_config(layout="wide", page_title="Cardiac Service Decision Support")
 
 # --- 1. CACHING ENGINE (Speed Optimization) ---
-@st.cache_data
-def get_cached_ai(params, target):
-    return find_ai_recommendation(params, target)
+# A disk cache that survives restarts and is shared by every server process (see cache.py)
+@st.cache_resource
+def get_disk_cache():
+    return ResultCache()
+
+# Engine work runs in the background on one service per server process: a bounded pool that
+# lets sessions asking for the same scenario share one computation and turns bursts away
+@st.cache_resource
+def get_service():
+    return SimulationService(max_workers=4, max_pending=32, max_heavy=2)
+
+# Stress-test batches fan out over one process pool per server process, so a stress test
+# uses every core instead of a single service thread
+@st.cache_resource
+def get_process_pool():
+    return replication_pool()
+
+def get_jobs():
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = JobRunner(get_service())
+    return st.session_state.jobs
+
+def submit_job(jobs, name, key, fn):
+    """Submits through the shared service; if it is full, flags the page to retry shortly."""
+    try:
+        jobs.submit(name, key, fn)
+    except ServiceBusy:
+        st.session_state.service_busy = True
+
+JOB_LABELS = {'strategies': "Baseline & Proposed", 'ai': "AI optimizer", 'ai_run': "AI scenario", 'stress': "Stress test",
+              'sweep': "Sensitivity sweep", 'rare': "Breach probability", 'profile': "Engine profile"}
 
-@st.cache_data
-def get_cached_sim(params, ward, seed=42):
-    return run_simulation(params, ward, seed=seed)
+@st.fragment(run_every=0.5)
+def watch_jobs(jobs):
+    """Polls background jobs and reruns the page when one finishes or publishes new partial results."""
+    if jobs.changed() or (st.session_state.get('service_busy') and jobs.service.has_room()):
+        st.rerun()
+
+@st.fragment(run_every=2)
+def live_ward(path, params, pace, target_wk, titles):
+    """Wall display: applies newly logged ward events and re-forecasts only when the bed profile changes."""
+    feed = st.session_state.get('ward_feed')
+    if feed is None or feed.path != path or feed.physical_beds != params['total_beds']:
+        feed = st.session_state.ward_feed = WardFeed(path, params['total_beds'])
+    forecaster = st.session_state.get('ward_forecaster')
+    if forecaster is None or forecaster.params != params:
+        forecaster = st.session_state.ward_forecaster = WardForecaster(params, cache=get_disk_cache())
+        st.session_state.live_result = None
+    # The fragment polls its own runner, so a finished re-forecast doesn't rerun the whole page
+    if 'live_jobs' not in st.session_state:
+        st.session_state.live_jobs = JobRunner(get_service())
+    live_jobs = st.session_state.live_jobs
+    feed.poll(pace or None)
+
+    # Re-forecasts run on the service and the display keeps the last one meanwhile. The forecaster
+    # is updated in place, so a new ward waits until the running re-forecast is done
+    ward = feed.ward()
+    live_key = (params, ward_profile(ward, forecaster.weeks).tolist())
+    job = live_jobs.get('forecast')
+    if job is None or (job.key != live_key and job.done()):
+        def reforecast(job):
+            forecaster.update(ward)
+            return forecaster.to_frame(), dict(forecaster.last)
+        submit_job(live_jobs, 'forecast', live_key, reforecast)
+    forecast, done = live_jobs.latest('forecast')
+    if done and live_jobs.get('forecast').key[0] == params:
+        st.session_state.live_result = forecast
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Events Applied", feed.n_events, f"{len(feed.errors)} skipped" if feed.errors else None, delta_color="off")
+    if st.session_state.live_result is not None:
+        live_frame, last = st.session_state.live_result
+        m2.metric("Last Re-forecast", f"{last['seconds'] * 1e3:.0f} ms",
+                  "from cache" if last['source'] == 'cache' else f"{last['rerun']}/{forecaster.n_reps} runs redone", delta_color="off")
+        breach = live_frame['Over_26_Wks_breach']
+        m3.metric(f"Breach Risk at Week {target_wk}", f"{breach.iloc[min(target_wk, len(breach) - 1)]:.0%}")
+    else:
+        m2.metric("Last Re-forecast", "⏳", "first forecast running", delta_color="off")
+    if feed.errors:
+        with st.expander("⚠️ Skipped feed events"):
+            st.code("\n".join(feed.errors[-20:]))
+    render_ward_ops(feed.snapshot(), params['total_beds'])
+    if st.session_state.live_result is not None:
+        render_triple_charts(live_frame, live_frame, live_frame, titles, key="live_forecast")
 
 # --- 2. SIDEBAR: PARAMETERS ---
 with st.sidebar:
@@ -85,51 +175,147 @@ if submit_btn or st.session_state.init:
         'los_cat1': l1, 'los_cat2': l2, 'los_cat3': l3, 'los_cat4': l4, 'los_cat5': l5,
         'surg_per_week': c_s, 'total_beds': c_b, 'safety_buffer': p_buff 
     }
+    cache = get_disk_cache()
+    jobs = get_jobs()
 
-    with st.spinner("Analyzing Clinical Pathways..."):
-        # 1. Get AI Recommendation (CACHED)
-        ai_surg, ai_beds = get_cached_ai(common, target_wk)
-        
-        # 2. Define parameters
-        params_c = {**common, 'surg_per_week': c_s, 'total_beds': c_b, 'safety_buffer': c_buff}
-        params_p = {**common, 'surg_per_week': p_s, 'total_beds': p_b, 'safety_buffer': p_buff}
-        params_ai = {**common, 'surg_per_week': ai_surg, 'total_beds': ai_beds, 'safety_buffer': p_buff}
+    # 1. Define parameters
+    params_c = {**common, 'surg_per_week': c_s, 'total_beds': c_b, 'safety_buffer': c_buff}
+    params_p = {**common, 'surg_per_week': p_s, 'total_beds': p_b, 'safety_buffer': p_buff}
+
+    # 2. Submit the engine work (CACHED); resubmitting unchanged inputs picks up the running job,
+    # changed inputs cancel the stale one. Strategies branch off a shared starting state.
+    st.session_state.service_busy = False
+    submit_job(jobs, 'strategies', (common, params_c, params_p),
+               lambda job: cached_branches(cache, common, [], {'c': params_c, 'p': params_p}))
+    submit_job(jobs, 'ai', (common, target_wk), lambda job: cached_ai_recommendation(cache, common, target_wk))
 
-        # 3. Run simulations (CACHED)
-        df_c_strat = get_cached_sim(params_c, [])
-        df_p_strat = get_cached_sim(params_p, [])
-        df_ai_strat = get_cached_sim(params_ai, [])
+    # 3. Render whatever has landed; the AI scenario can only start once its recommendation is known
+    strats = jobs.result('strategies')
+    df_c_strat = strats['c'].to_frame(include_ward=False) if strats else None
+    df_p_strat = strats['p'].to_frame(include_ward=False) if strats else None
 
-        common['det_events_mean'] = df_ai_strat['det_events'].mean()
+    ai_rec = jobs.result('ai')
+    params_ai = df_ai_strat = None
+    if ai_rec is not None:
+        ai_surg, ai_beds, ai_conf = ai_rec
+        params_ai = {**common, 'surg_per_week': ai_surg, 'total_beds': ai_beds, 'safety_buffer': p_buff}
+        submit_job(jobs, 'ai_run', params_ai, lambda job: cached_branches(cache, common, [], {'ai': params_ai})['ai'])
+        ai_run = jobs.result('ai_run')
+        if ai_run is not None:
+            df_ai_strat = ai_run.to_frame(include_ward=False)
+    ai_title = f"AI TARGET: {ai_surg}S / {ai_beds}B" if ai_rec else "AI TARGET: searching..."
+
+    # Until a simulation lands, its scenario shows the fluid model's estimate (a few ms each)
+    estimated = []
+    if strats is None:
+        df_c_strat, df_p_strat = fluid_simulation(params_c, []), fluid_simulation(params_p, [])
+        estimated += ["Baseline", "Proposed"]
+    if params_ai is not None and df_ai_strat is None:
+        df_ai_strat = fluid_simulation(params_ai, [])
+        estimated.append("AI Target")
 
     # --- 4. MAIN UI ---
     st.title("Cardiac Service Strategy: Executive Decision Suite")
-    st.success(f"**AI Recommendation:** To achieve stability by Week {target_wk}, allocate **{ai_surg} Slots** and **{ai_beds} Beds**.")
+    pending = jobs.pending()
+    if st.session_state.service_busy:
+        st.warning("⚠️ The simulation server is at capacity; your scenarios will start as soon as a slot frees up.")
+    if pending:
+        st.caption("⏳ Still computing: " + ", ".join(JOB_LABELS.get(n, n) for n in pending))
+    if ai_rec is None:
+        st.info(f"**AI Recommendation:** Searching bed and theater configurations for stability by Week {target_wk}...")
+    else:
+        st.success(f"**AI Recommendation:** To achieve stability by Week {target_wk}, allocate **{ai_surg} Slots** and **{ai_beds} Beds** ({ai_conf:.0%} of simulated futures breach-free).")
 
     with st.expander("💡 Strategic Rationale", expanded=False):
         time_rationale = "immediate stabilization" if target_wk < 20 else "long-term sustainable flow"
-        st.write(f"The AI determined that **{ai_beds} beds** are required for **{time_rationale}**.")
+        if ai_rec is not None:
+            st.write(f"The AI determined that **{ai_beds} beds** are required for **{time_rationale}**.")
         c1, c2, c3 = st.columns(3)
         c1.markdown("**1. Clinical Safety** \nZero-tolerance for patients exceeding the 26-week threshold.")
         c2.markdown("**2. Financial Resilience** \nPrioritizes preventing theater cancellations (Est. AED 15,000 cost/event).")
         c3.markdown("**3. Patient Experience** \nMaintains a 'Safety Buffer' to protect facility reputation and honor surgical dates.")
         st.info(f"**Operational Insight:** The AI prioritizes 'Safety Buffer' over occupancy because the cost of an idle bed is 10x lower than the cost of a cancelled theater slot.")
 
-    tab1, tab2, tab3 = st.tabs(["📊 Strategy Comparison", "🛌 Operations & Floor Map", "🔬 Model Transparency"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📊 Strategy Comparison", "🛌 Operations & Floor Map", "🔬 Model Transparency", "⏱️ Performance"])
 
     with tab1:
-        render_executive_kpis(df_c_strat, df_p_strat, df_ai_strat)
-        titles = [f"BASELINE: {c_s}S / {c_b}B", f"PROPOSED: {p_s}S / {p_b}B", f"AI TARGET: {ai_surg}S / {ai_beds}B"]
+        render_executive_kpis(df_c_strat, df_p_strat, df_ai_strat, estimated)
+        titles = [f"BASELINE: {c_s}S / {c_b}B", f"PROPOSED: {p_s}S / {p_b}B", ai_title]
+        titles = [t + (" (ESTIMATE)" if name in estimated else "") for t, name in zip(titles, ["Baseline", "Proposed", "AI Target"])]
         render_triple_charts(df_c_strat, df_p_strat, df_ai_strat, titles, key="strategy_comparison")
         
-        if st.button("🚀 Run 52-Week Stress Test"):
-            st.markdown("### Stress Test: 20 Parallel Simulation Runs")
-            runs = [run_simulation(params_ai, [], seed=i) for i in range(20)]
-            render_monte_carlo_cloud(pd.concat(runs))
+        stress_tol = st.slider("Stress Test Precision (± patients at target week)", 0.1, 2.0, 0.5,
+                               help="Runs keep streaming in until the expected breach count at the target week is this tight.")
+        stress_key = (params_ai, target_wk, stress_tol)
+        if st.button("🚀 Run 52-Week Stress Test", disabled=params_ai is None):
+            # Replications stream into per-week statistics and stop once the target week is pinned down;
+            # each batch publishes the bands so far. Stress tests are heavy, so the server caps how many run at once
+            try:
+                jobs.submit('stress', stress_key, lambda job: stream_replications(
+                    params_ai, [], weeks=max(52, target_wk + 1), target_week=target_wk, tol=stress_tol, seed=0,
+                    on_batch=lambda summary: job.publish(summary.to_frame()), cancel=job.cancel_event,
+                    pool=get_process_pool()).to_frame(),
+                    heavy=True)
+                st.rerun()
+            except ServiceBusy:
+                st.warning("⚠️ Too many stress tests are running on the server right now. Please try again in a moment.")
+        stress_job = jobs.get('stress')
+        if stress_job is not None and stress_job.key != stress_key:
+            jobs.cancel('stress')  # inputs moved on; stop burning replications on the old scenario
+        elif stress_job is not None:
+            stress_frame, stress_done = jobs.latest('stress')
+            if stress_frame is not None:
+                streaming = "" if stress_done else " (streaming...)"
+                st.markdown(f"### Stress Test: {stress_frame.attrs['n_reps']:,} Simulation Runs{streaming}")
+                render_monte_carlo_cloud(stress_frame)
+
+        # The window after the target week must fit in the 52-week horizon
+        rare_start = min(target_wk, 50)
+        rare_key = (params_ai, rare_start)
+        if st.button("🎯 Estimate Breach Probability", disabled=params_ai is None,
+                     help="Chance anyone waits 26+ weeks after the target week. Splitting concentrates runs on the "
+                          "ones heading for a breach, so even very small probabilities get a confidence interval."):
+            try:
+                jobs.submit('rare', rare_key, lambda job: breach_probability(
+                    params_ai, start_week=rare_start, n_particles=100, n_repeats=10, seed=0,
+                    on_repeat=job.publish, cancel=job.cancel_event), heavy=True)
+                st.rerun()
+            except ServiceBusy:
+                st.warning("⚠️ Too many heavy runs on the server right now. Please try again in a moment.")
+        rare_job = jobs.get('rare')
+        if rare_job is not None and rare_job.key != rare_key:
+            jobs.cancel('rare')
+        elif rare_job is not None:
+            est, rare_done = jobs.latest('rare')
+            if est is not None:
+                lo, hi = est.ci
+                label = f"P(26-Week Breach after Week {rare_start})" + ("" if rare_done else " (refining...)")
+                if est.probability > 0:
+                    st.metric(label, f"{est.probability:.2e}", f"95% CI {lo:.1e} – {hi:.1e}", delta_color="off")
+                    if not np.isfinite(est.std_error):
+                        st.caption("One splitting run so far; the interval needs at least two.")
+                    elif est.speedup >= 1:
+                        st.caption(f"{len(est.estimates)} independent splitting runs, {est.speedup:,.1f}x faster than "
+                                   f"plain Monte Carlo (~{est.naive_runs:,.0f} runs) for the same precision.")
+                    else:
+                        st.caption(f"{len(est.estimates)} independent splitting runs. At this probability plain Monte "
+                                   f"Carlo (~{est.naive_runs:,.0f} runs) would have been {1 / est.speedup:,.1f}x faster; "
+                                   f"the stress test is the cheaper tool here.")
+                else:
+                    st.metric(label, "≈ 0", "no run reached a breach", delta_color="off")
 
     with tab2:
         st.subheader("Operational Forecast & Live Ward State")
 
+        # A bed-management event log drives a live floor map and forecast without touching the table below
+        feed_path = st.text_input("📡 Live Ward Feed (JSONL/CSV event log)", value=os.environ.get('CARDIAC_WARD_FEED', ''),
+                                  help="Admission, discharge and update events, e.g. replayed from the bed-management system.")
+        if feed_path:
+            replay_pace = st.number_input("Replay Pace (events per refresh, 0 = all new events)", 0, 100, 0)
+            live_ward(feed_path, params_p, replay_pace, target_wk,
+                      [f"BASELINE: {c_s}S / {c_b}B", f"PROPOSED: {p_s}S / {p_b}B", ai_title])
+            st.divider()
+
         # 1. Initialize data if not present
         if 'ward_data' not in st.session_state:
             st.session_state.ward_data = pd.DataFrame([
@@ -143,6 +329,8 @@ if submit_btn or st.session_state.init:
         with st.form("ward_init"):
             st.write("Current Ward Status (Input live occupancy for forecasting)")
             edited_ward = st.data_editor(st.session_state.ward_data, num_rows="fixed")
+            resolution = st.radio("Forecast Resolution", ["Weekly", "Daily"], horizontal=True,
+                                  help="Daily runs the event-driven engine to expose mid-week bed-chokes.")
             run_op_btn = st.form_submit_button("Generate Operational Forecast")
 
         if run_op_btn:
@@ -152,7 +340,10 @@ if submit_btn or st.session_state.init:
             active_ward = edited_ward[edited_ward['Occupied']].to_dict('records')
             # 3. CONSTRAIN: Run the model using your PROPOSED params and LIVE ward
             # This is where the 'Third Graph' data is created
-            st.session_state.op_results = run_simulation(params_p, active_ward, seed=42)
+            if resolution == "Daily":
+                st.session_state.op_results = run_event_simulation(params_p, active_ward, seed=42)
+            else:
+                st.session_state.op_results = run_simulation(params_p, active_ward, seed=42)
             # 4. RESET: Ensure the slider starts at Week 0 for the new forecast
             st.session_state.op_week_slider = 0
             # Force a rerun to ensure the results are visible to the code below
@@ -163,32 +354,26 @@ if submit_btn or st.session_state.init:
             res = st.session_state.op_results
     
             # 1. Timeline Control
-            view_wk = st.select_slider("Forecast Timeline (Week):", options=range(len(res)), key="op_week_slider")
-            # 🟢 FIX: Define the row first so the code knows what 'target_row' is
-            target_row = res.iloc[view_wk]    
+            unit = "Day" if res.period_days == 1 else "Week"
+            view_wk = st.select_slider(f"Forecast Timeline ({unit}):", options=range(len(res)), key="op_week_slider")
             # 2. Extract specific week (This is the 'Who' is in the beds)
-            # We take the 'ward_state' list we created in the engine
-            current_ward_list = res.iloc[view_wk]['ward_state'] 
-    
-            # 3. Create a snapshot dict for the visualizer
-            current_snapshot = {
-                'ward_state': target_row['ward_state'],
-                'admissions': target_row['admissions']  # <--- THIS IS THE MISSING LINK
-            }
+            # Only this week's ward snapshot is expanded into per-bed dicts
+            current_snapshot = res.week_snapshot(view_wk)
     
-            # 4. Render (This is the 'Where' - total beds)
+            # 3. Render (This is the 'Where' - total beds)
             # This solves the TypeError by providing BOTH arguments
             render_ward_ops(current_snapshot, params_p['total_beds'])
     
-            # 5. The "Third Graph" - Prove the impact of your manual table
+            # 4. The "Third Graph" - Prove the impact of your manual table
             st.divider()
             st.subheader("Operational Impact on Throughput")
             titles = [
                 f"BASELINE: {c_s}S / {c_b}B", 
                 f"PROPOSED: {p_s}S / {p_b}B", 
-                f"AI TARGET: {ai_surg}S / {ai_beds}B"
+                ai_title
             ]
-            render_triple_charts(res, res, res, titles, key="operational_forecast")
+            res_frame = res.to_frame(include_ward=False)
+            render_triple_charts(res_frame, res_frame, res_frame, titles, key="operational_forecast")
 
     with tab3:
         st.subheader("🤖 Intelligence Engine: The 'Friction' Model")
@@ -198,4 +383,65 @@ if submit_btn or st.session_state.init:
         col3.metric("Idle Capacity Cost", "AED 1,500", "Weight: 20")
         st.markdown("> **Decision Logic:** The AI chooses to have a spare bed ready rather than risk a cancellation, as the financial and reputational friction of a cancelled slot is 10x higher.")
         st.divider()
-        render_variance_analysis(common)
\ No newline at end of file
+        if df_ai_strat is not None:
+            render_variance_analysis({**common, 'det_events_mean': df_ai_strat['det_events'].mean()})
+        else:
+            render_variance_analysis(common)
+
+        # Global sensitivity of the Proposed plan: one resumable sweep store per scenario on disk.
+        # A low-priority worker process keeps the sweep off this server's GIL and CPU; `python sweep.py` runs the big ones
+        st.divider()
+        sweep_path = os.path.join(cache.root, 'sweeps', cache_key('sweep', base=params_p)[:16])
+        sweep_job = jobs.get('sweep')
+        if st.button("🧪 Run Sensitivity Sweep (500 scenarios)"):
+            try:
+                sweep_job = jobs.submit('sweep', sweep_path, lambda job: run_sweep(
+                    sweep_path, params_p, n_designs=500, max_workers=1, niceness=10, chunk_size=50,
+                    on_chunk=lambda done, total: job.publish((done, total)), cancel=job.cancel_event), heavy=True)
+            except ServiceBusy:
+                st.warning("⚠️ The server is busy with other heavy runs. Please try again in a moment.")
+        if sweep_job is not None and sweep_job.key != sweep_path:
+            jobs.cancel('sweep')  # Proposed plan changed; the finished chunks stay on disk for later
+        elif sweep_job is not None:
+            progress, finished = jobs.latest('sweep')
+            if not finished:
+                done, total = progress or (0, 1)
+                st.progress(done / total, text=f"Sweeping scenarios: chunk {done} of {total}")
+        if SweepStore.exists(sweep_path):
+            store = SweepStore(sweep_path)
+            metric_labels = {'over_26_mean': "Legacy Breach at Target", 'cancellations': "Annual Cancellations",
+                             'backlog_end': "Year-End Backlog", 'occupancy': "Bed Occupancy"}
+            sweep_metric = st.selectbox("Outcome", list(metric_labels), format_func=metric_labels.get)
+            if store.completed().sum() >= 20:
+                render_sensitivity(sensitivity_indices(store, sweep_metric), metric_labels[sweep_metric], key="sensitivity")
+
+    with tab4:
+        # Profiled runs are never cached: the point is to time the engine as it runs now
+        prof_options = ["Baseline", "Proposed"] + (["AI Target"] if params_ai is not None else [])
+        prof_choice = st.radio("Scenario to Profile", prof_options, horizontal=True)
+        prof_params = {"Baseline": params_c, "Proposed": params_p, "AI Target": params_ai}[prof_choice]
+        prof_key = (prof_choice, prof_params)
+        if st.button("⏱️ Profile Engine"):
+            # Runs on the service like any other job, so the page's own reruns never re-time the engine
+            submit_job(jobs, 'profile', prof_key, lambda job: run_simulation(prof_params, [], seed=42, profile=True).profile)
+            st.rerun()
+        prof_job = jobs.get('profile')
+        if prof_job is not None and prof_job.key == prof_key:
+            profile, _ = jobs.latest('profile')
+            if profile is not None:
+                render_performance_profile(profile, key="perf_profile")
+        else:
+            st.caption("Press Profile Engine to time one run of the selected scenario, phase by phase.")
+
+        st.subheader("Shared Simulation Service")
+        load = jobs.service.load()
+        s1, s2, s3, s4 = st.columns(4)
+        s1.metric("Requests In Flight", load['in_flight'], f"{load['heavy_in_flight']} heavy", delta_color="off")
+        s2.metric("Sessions Waiting", load['subscribers'])
+        s3.metric("Shared (Coalesced)", load['coalesced'])
+        s4.metric("Turned Away", load['rejected'])
+
+    # Poll last, once every tab has read its jobs; anything that landed while this run was
+    # rendering is still unseen, so the watcher reruns straight away
+    if jobs.pending() or jobs.changed() or st.session_state.service_busy:
+        watch_jobs(jobs)
\ No newline at end of file
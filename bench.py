@@ -0,0 +1,184 @@
+"""Engine and optimizer benchmarks.
+
+    python bench.py                      # run every grid and print the table
+    python bench.py --quick              # smallest point of each grid only
+    python bench.py --save               # also write bench_baseline.json
+    python bench.py --compare            # flag cases slower than the baseline
+
+Each grid varies one axis around the app's default scenario (REFERENCE) so a slowdown
+points at the dimension that caused it. Wall time is the best of --repeat runs; memory and
+the count of allocations the run leaves live are measured in a separate traced run so
+tracemalloc's overhead never reaches the timings.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from engine import run_simulation, run_simulation_batch, find_ai_recommendation
+from surrogate import fluid_simulation
+from network import run_network
+from rare import breach_probability
+
+# The dashboard's default sidebar values (Baseline scenario)
+REFERENCE = {
+    'total_backlog': 60, 'dist_legacy': 10, 'weekly_refs': 6,
+    'dist_cat1': 10, 'dist_cat2': 15, 'dist_cat3': 20, 'dist_cat4': 30, 'dist_cat5': 25,
+    'det_5to4': 0.02, 'det_4to3': 0.04, 'det_3to2': 0.07, 'det_2to1': 0.12,
+    'los_scale': 1.0, 'los_cat1': 22, 'los_cat2': 11, 'los_cat3': 5, 'los_cat4': 2, 'los_cat5': 2,
+    'surg_per_week': 3, 'total_beds': 7, 'safety_buffer': 0,
+}
+REFERENCE_TARGET_WK = 26
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+def _single(overrides=None, weeks=52):
+    params = {**REFERENCE, **(overrides or {})}
+    return (lambda: run_simulation(params, [], weeks=weeks, seed=0)), weeks
+
+def _batch(n_reps, weeks=52, overrides=None):
+    params = {**REFERENCE, **(overrides or {})}
+    return (lambda: run_simulation_batch(params, [], weeks=weeks, n_reps=n_reps, seed=0)), weeks * n_reps
+
+def _optimizer(target_wk):
+    return (lambda: find_ai_recommendation(REFERENCE, target_wk)), None
+
+def _fluid(weeks=52):
+    return (lambda: fluid_simulation(REFERENCE, [], weeks=weeks)), weeks
+
+def _network(n_sites, weeks=52):
+    # REFERENCE-sized units in four regions, pooled referrals so overflow and routing both run
+    sites = [{'total_beds': REFERENCE['total_beds'] + i % 5, 'surg_per_week': REFERENCE['surg_per_week'] + i % 3,
+              'weekly_refs': REFERENCE['weekly_refs'], 'total_backlog': REFERENCE['total_backlog'], 'region': i % 4}
+             for i in range(n_sites)]
+    return (lambda: run_network(REFERENCE, sites, weeks=weeks, routing='balanced', seed=0)), weeks * n_sites
+
+def _rare(slots, beds):
+    # The 🎯 button's settings on a well-resourced plan; the calibration batch is kept small
+    params = {**REFERENCE, 'surg_per_week': slots, 'total_beds': beds}
+    return (lambda: breach_probability(params, start_week=REFERENCE_TARGET_WK, n_particles=100, n_repeats=10,
+                                       seed=0, mc_reps=64)), None
+
+# name -> [(case label, factory returning (callable, simulated weeks or None))]
+GRIDS = {
+    'backlog': [(f'total_backlog={n}', lambda n=n: _single({'total_backlog': n}))
+                for n in (60, 1_000, 10_000, 100_000)],
+    'horizon': [(f'weeks={w}', lambda w=w: _single(weeks=w)) for w in (26, 52, 104, 260, 520)],
+    'referrals': [(f'weekly_refs={r}', lambda r=r: _single({'weekly_refs': r})) for r in (3, 6, 10, 15)],
+    'beds': [(f'total_beds={b}', lambda b=b: _single({'total_beds': b, 'surg_per_week': max(1, b // 2)}))
+             for b in (4, 7, 15, 40)],
+    'replications': [(f'n_reps={n}', lambda n=n: _batch(n)) for n in (10, 100, 1_000)],
+    # Large lists in the batched engine, where per-week full-array passes dominate
+    'batch_backlog': [(f'backlog={n},n_reps=100', lambda n=n: _batch(100, overrides={'total_backlog': n}))
+                      for n in (1_000, 10_000)],
+    'optimizer': [(f'target_wk={REFERENCE_TARGET_WK}', lambda: _optimizer(REFERENCE_TARGET_WK))],
+    'surrogate': [(f'weeks={w}', lambda w=w: _fluid(w)) for w in (52, 260)],
+    'network': [(f'sites={n}', lambda n=n: _network(n)) for n in (10, 100, 500)],
+    'rare': [(f'slots={s},beds={b}', lambda s=s, b=b: _rare(s, b)) for s, b in ((9, 16), (10, 18))],
+}
+
+def measure(fn, weeks, repeat=3):
+    """Best-of-repeat wall time, plus tracemalloc peak, retained memory and retained blocks of one extra run."""
+    fn()  # warm-up: imports, first-touch allocations
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    out = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    tracemalloc.stop()
+    del out
+    return {
+        'wall_s': best,
+        'per_week_ms': best / weeks * 1e3 if weeks else None,
+        'peak_mb': peak / 2**20,
+        'retained_mb': current / 2**20,
+        'retained_blocks': sum(stat.count for stat in snapshot.statistics('filename')),
+    }
+
+def run(grids, quick=False, repeat=3):
+    results = {}
+    for grid in grids:
+        cases = GRIDS[grid][:1] if quick else GRIDS[grid]
+        for label, factory in cases:
+            fn, weeks = factory()
+            key = f'{grid}/{label}'
+            results[key] = measure(fn, weeks, repeat=1 if grid in ('optimizer', 'rare') else repeat)
+            _print_row(key, results[key])
+    return results
+
+def _print_row(key, r, base=None):
+    per_week = f"{r['per_week_ms']:9.3f}" if r['per_week_ms'] is not None else '        -'
+    line = (f"{key:32s} {r['wall_s']:9.4f}s {per_week}ms/wk {r['peak_mb']:8.2f}MB peak {r['retained_mb']:7.2f}MB kept"
+            f" {r['retained_blocks']:7d} blocks")
+    if base is not None:
+        line += f"   x{r['wall_s'] / base['wall_s']:.2f} vs baseline"
+        if 'retained_blocks' in base:
+            line += f", {r['retained_blocks'] - base['retained_blocks']:+d} blocks"
+    print(line, flush=True)
+
+def compare(results, baseline, tolerance, min_delta=0.005):
+    """(cases whose wall time grew by more than `tolerance` (a fraction) over the baseline,
+    cases the baseline has no entry for).
+
+    Slowdowns under min_delta seconds are ignored; millisecond cases are mostly timer noise.
+    """
+    slower, missing = [], []
+    for key, r in results.items():
+        base = baseline['results'].get(key)
+        if base is None:
+            missing.append(key)
+        elif r['wall_s'] - base['wall_s'] > max(tolerance * base['wall_s'], min_delta):
+            slower.append(key)
+    return slower, missing
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('grids', nargs='*', help=f"grids to run (default: all of {', '.join(GRIDS)})")
+    ap.add_argument('--quick', action='store_true', help='first point of each grid only')
+    ap.add_argument('--repeat', type=int, default=3)
+    ap.add_argument('--baseline', default=BASELINE_FILE)
+    ap.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    ap.add_argument('--compare', action='store_true', help='exit 1 if any case regressed')
+    ap.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, e.g. 0.25 = 25%%')
+    ap.add_argument('--min-delta', type=float, default=0.005, help='ignore slowdowns under this many seconds')
+    args = ap.parse_args(argv)
+    unknown = set(args.grids) - set(GRIDS)
+    if unknown:
+        ap.error(f"unknown grid(s): {', '.join(sorted(unknown))}")
+
+    results = run(args.grids or list(GRIDS), quick=args.quick, repeat=args.repeat)
+
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline} ({baseline['machine']}):")
+        for key, r in results.items():
+            _print_row(key, r, baseline['results'].get(key))
+        slower, missing = compare(results, baseline, args.tolerance, args.min_delta)
+        if missing:
+            print(f"\n{len(missing)} case(s) with no baseline, refresh it with --save: " + ', '.join(missing))
+        if slower:
+            print(f"\n{len(slower)} case(s) more than {args.tolerance:.0%} slower: " + ', '.join(slower))
+        if missing or slower:
+            return 1
+        print('\nNo regressions.')
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': f'{platform.platform()} python {platform.python_version()} numpy {np.__version__}',
+                       'results': results}, f, indent=2)
+        print(f'Saved {len(results)} cases to {args.baseline}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from engine import ENGINE_VERSION, SimulationResult, find_ai_recommendation, run_branches
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'cardiac_model')
+DEFAULT_MAX_MB = 256
+
+def _canonical(obj):
+    """JSON-ready copy with NumPy scalars unwrapped and integral floats folded into ints."""
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float) and obj.is_integer():
+        return int(obj)
+    return obj
+
+def cache_key(kind, **parts):
+    """sha256 of the canonical JSON of (kind, engine version, parts): same inputs, same key."""
+    payload = {'kind': kind, 'engine': ENGINE_VERSION, **parts}
+    text = json.dumps(_canonical(payload), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    """Content-addressed store of engine outputs as .npz files, shared by every process.
+
+    Writes go to a temp file in the cache directory and are moved into place with
+    os.replace, so readers only ever see complete entries and concurrent writers of the
+    same key just race to store identical bytes. Hits refresh the file's mtime, and once
+    the directory exceeds max_mb the least recently used entries are deleted.
+    """
+
+    def __init__(self, root=None, max_mb=None):
+        self.root = root or os.environ.get('CARDIAC_CACHE_DIR', DEFAULT_DIR)
+        self.max_bytes = int((max_mb or float(os.environ.get('CARDIAC_CACHE_MAX_MB', DEFAULT_MAX_MB))) * 2**20)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key + '.npz')
+
+    def get(self, key):
+        """{name: array} for a stored key, or None on a miss (or an entry evicted mid-read)."""
+        path = self._path(key)
+        try:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            os.utime(path)
+        except (FileNotFoundError, zipfile.BadZipFile, EOFError, ValueError):
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Deletes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith('.npz'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another process got there first
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(('.npz', '.tmp')):
+                os.remove(entry.path)
+
+    def size_bytes(self):
+        return sum(e.stat().st_size for e in os.scandir(self.root) if e.name.endswith('.npz'))
+
+def cached_branches(cache, params, current_ward, branches, seed=42, weeks=52, fork_week=0, crn=True):
+    """run_branches through the disk cache; returns {name: SimulationResult}."""
+    key = cache_key('branches', params=params, ward=current_ward, branches=branches, seed=seed,
+                    weeks=weeks, fork_week=fork_week, crn=crn)
+    arrays = cache.get(key)
+    if arrays is None:
+        results = run_branches(params, current_ward, branches, fork_week=fork_week, weeks=weeks, seed=seed, crn=crn)
+        arrays = {f'{name}__{col}': a for name, res in results.items() for col, a in res.to_arrays().items()}
+        cache.put(key, arrays)
+        return results
+    columns = {}
+    for col, a in arrays.items():
+        name, field = col.split('__', 1)
+        columns.setdefault(name, {})[field] = a
+    return {name: SimulationResult.from_arrays(columns[name]) for name in branches}
+
+def cached_ai_recommendation(cache, params, target_wk, **kwargs):
+    """find_ai_recommendation through the disk cache; returns (slots, beds, confidence)."""
+    key = cache_key('ai', params=params, target_wk=target_wk, options=kwargs)
+    arrays = cache.get(key)
+    if arrays is None:
+        slots, beds, confidence = find_ai_recommendation(params, target_wk, **kwargs)
+        cache.put(key, {'slots': np.array(slots), 'beds': np.array(beds), 'confidence': np.array(confidence)})
+        return slots, beds, confidence
+    return int(arrays['slots']), int(arrays['beds']), float(arrays['confidence'])
@@ -0,0 +1,175 @@
+"""Headless batch runner for scheduled planning jobs.
+
+    python cli.py scenarios.yaml --out results/                 # Parquet, all cores
+    python cli.py scenarios.json --out results/ --format npz --workers 4
+
+The scenario file (JSON, or YAML if PyYAML is installed) is either a list of scenarios or
+{"defaults": {...params...}, "scenarios": [...]}. Each scenario has a name (letters, digits,
+'_', '.' and '-', as it names the output file) and params (merged over the defaults), and
+optionally reps, weeks, seed and ward (the current ward as a list of {"cat", "days_remaining"}).
+reps=1 runs run_simulation, as the dashboard does; more runs the vectorized batch engine.
+
+Results are written as each scenario finishes, so memory stays flat however long the list:
+Parquet appends one row group per scenario to results.parquet (needs pyarrow), NPZ writes
+one <name>.npz per scenario. Either way every row is (rep, week) with BATCH_COLUMNS, and
+manifest.jsonl gets a line per scenario with its timing or error. Only NumPy and the engine
+are imported at startup; no Streamlit, plotly or pandas.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from engine import BATCH_COLUMNS, batch_arrays, run_simulation
+
+REQUIRED_PARAMS = ('total_beds', 'safety_buffer', 'surg_per_week', 'weekly_refs')
+# Names become file names under --out, so nothing that could be a path separator
+SCENARIO_NAME = re.compile(r'[A-Za-z0-9_.-]+')
+
+def load_scenarios(path):
+    """Scenario dicts from a JSON/YAML file, with defaults merged in and names checked."""
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml  # optional: only YAML scenario files need PyYAML
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'scenarios': spec}
+    defaults = spec.get('defaults', {})
+
+    scenarios, seen = [], set()
+    for i, raw in enumerate(spec['scenarios']):
+        scenario = {'name': f'scenario_{i}', **raw, 'params': {**defaults, **raw.get('params', {})}}
+        if not isinstance(scenario['name'], str) or not SCENARIO_NAME.fullmatch(scenario['name']):
+            raise ValueError(f"scenario name {scenario['name']!r} may only use letters, digits, '_', '.' and '-'")
+        missing = [k for k in REQUIRED_PARAMS if k not in scenario['params']]
+        if missing:
+            raise ValueError(f"scenario {scenario['name']!r} is missing params: {', '.join(missing)}")
+        if scenario['name'] in seen:
+            raise ValueError(f"duplicate scenario name {scenario['name']!r}")
+        seen.add(scenario['name'])
+        scenarios.append(scenario)
+    return scenarios
+
+def run_scenario(scenario, weeks=52, reps=1, seed=None):
+    """(rows, BATCH_COLUMNS) int64 table for one scenario; its own keys override the arguments."""
+    weeks = scenario.get('weeks', weeks)
+    reps = scenario.get('reps', reps)
+    seed = scenario.get('seed', seed)
+    ward = scenario.get('ward', [])
+    if reps > 1:
+        out = batch_arrays(scenario['params'], ward, weeks=weeks, n_reps=reps, seed=seed)
+        return out.transpose(1, 0, 2).reshape(reps * weeks, len(BATCH_COLUMNS))
+
+    res = run_simulation(scenario['params'], ward, weeks=weeks, seed=seed)
+    table = np.zeros((weeks, len(BATCH_COLUMNS)), dtype=np.int64)
+    table[:, 1] = np.arange(weeks)
+    table[:, 2:7] = res.backlog
+    table[:, 7] = res.over_26
+    table[:, 8] = res.occupancy
+    table[:, 9] = res.cancellations
+    table[:, 10] = res.det_events
+    return table
+
+def _timed(scenario, weeks, reps, seed):
+    t0 = time.perf_counter()
+    table = run_scenario(scenario, weeks, reps, seed)
+    return table, time.perf_counter() - t0
+
+class NpzSink:
+    """One <name>.npz per scenario, moved into place once complete."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+
+    def write(self, name, table):
+        path = os.path.join(self.out_dir, f'{name}.npz')
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, **{col: table[:, j] for j, col in enumerate(BATCH_COLUMNS)})
+        os.replace(tmp, path)
+        return path
+
+    def close(self):
+        pass
+
+class ParquetSink:
+    """results.parquet with one row group per scenario, appended as scenarios finish."""
+
+    def __init__(self, out_dir):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Parquet output needs pyarrow; install it or use --format npz')
+        self.pa = pa
+        self.path = os.path.join(out_dir, 'results.parquet')
+        self.schema = pa.schema([('scenario', pa.string())] + [(col, pa.int64()) for col in BATCH_COLUMNS])
+        self.writer = pq.ParquetWriter(self.path, self.schema)
+
+    def write(self, name, table):
+        columns = [self.pa.array([name] * len(table))] + [self.pa.array(table[:, j]) for j in range(len(BATCH_COLUMNS))]
+        self.writer.write_table(self.pa.Table.from_arrays(columns, schema=self.schema))
+        return self.path
+
+    def close(self):
+        self.writer.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('scenarios', help='JSON or YAML scenario file')
+    ap.add_argument('--out', default='results', help='output directory (created if needed)')
+    ap.add_argument('--format', choices=['parquet', 'npz'], default='parquet')
+    ap.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores; 0 runs inline)')
+    ap.add_argument('--weeks', type=int, default=52, help='default horizon for scenarios that do not set one')
+    ap.add_argument('--reps', type=int, default=1, help='default replications per scenario')
+    ap.add_argument('--seed', type=int, default=None, help='default seed per scenario')
+    args = ap.parse_args(argv)
+
+    try:
+        scenarios = load_scenarios(args.scenarios)
+    except (OSError, ValueError, KeyError) as e:
+        ap.error(f'{args.scenarios}: {e}')
+    os.makedirs(args.out, exist_ok=True)
+    sink = (ParquetSink if args.format == 'parquet' else NpzSink)(args.out)
+    failures = 0
+    t_start = time.perf_counter()
+
+    with open(os.path.join(args.out, 'manifest.jsonl'), 'w') as manifest:
+        def record(name, outcome):
+            nonlocal failures
+            try:
+                table, seconds = outcome()
+            except Exception as e:
+                failures += 1
+                entry = {'scenario': name, 'error': f'{type(e).__name__}: {e}'}
+            else:
+                entry = {'scenario': name, 'rows': len(table), 'seconds': round(seconds, 4),
+                         'file': sink.write(name, table)}
+            manifest.write(json.dumps(entry) + '\n')
+            manifest.flush()
+            print(json.dumps(entry), flush=True)
+
+        if args.workers == 0:
+            for s in scenarios:
+                record(s['name'], lambda s=s: _timed(s, args.weeks, args.reps, args.seed))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers) as pool:
+                pending = {pool.submit(_timed, s, args.weeks, args.reps, args.seed): s['name'] for s in scenarios}
+                for future in as_completed(pending):
+                    # Drop the finished future straight away so its table is freed once written
+                    record(pending.pop(future), future.result)
+    sink.close()
+
+    print(f'{len(scenarios) - failures}/{len(scenarios)} scenarios in {time.perf_counter() - t_start:.1f}s -> {args.out}',
+          file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
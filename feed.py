@@ -0,0 +1,298 @@
+"""Live ward feed: bed-management events in, an incrementally updated forecast out.
+
+    python feed.py ward_events.jsonl                  # replay a log, one event per poll
+    python feed.py ward_events.csv --follow           # keep tailing it like a live feed
+
+Events are JSON lines or CSV rows with the fields in EVENT_FIELDS:
+    {"time": "2026-10-17T08:00", "event": "admit", "bed": 3, "cat": 2, "days_remaining": 9}
+    {"time": "2026-10-18T14:30", "event": "discharge", "bed": 3}
+    {"time": "2026-10-18T15:00", "event": "update", "bed": 5, "days_remaining": 4}
+Beds are numbered from 0, as on the floor map. `time` (ISO timestamp, or a number of days) is
+optional; when given, the feed's clock is the latest event time and days remaining count down
+from each patient's admission or update.
+
+The forecast only depends on the ward through how many of its beds are still occupied in
+each future week, so WardForecaster keys everything on that profile. Events that leave it
+unchanged cost nothing, and when it does change each cached replication is rerun only if
+the change alters one of its admission decisions.
+"""
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from aggregate import SUMMARY_METRICS, StreamingSummary
+from cache import cache_key
+from engine import CATEGORIES, run_simulation
+
+EVENT_FIELDS = ('time', 'event', 'bed', 'cat', 'days_remaining')
+EVENT_TYPES = ('admit', 'discharge', 'update')
+
+def _as_days(value):
+    """Event time in days: a number of days as is, an ISO timestamp as days since the epoch."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp() / 86400
+
+class WardFeed:
+    """Tails a JSONL or CSV event log and keeps the live ward it describes.
+
+    poll() reads only what was appended since the last call, and never a half-written
+    last line. A malformed or inconsistent event is recorded in `errors` and skipped, so
+    one bad row does not take a wall display down. A log that shrinks is taken to be
+    rotated and is replayed from the start. Beds run from 0 to physical_beds - 1.
+    """
+
+    def __init__(self, path, physical_beds):
+        self.path = path
+        self.physical_beds = physical_beds
+        self.is_csv = path.lower().endswith('.csv')
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.line_no = 0
+        self.header = None
+        self.beds = {}        # bed -> {'cat', 'days_remaining', 'since'}
+        self.admitted = []    # (time, cat) of admissions, for the week's prescription panel
+        self.clock = None
+        self.n_events = 0
+        self.errors = []
+
+    def poll(self, max_events=None):
+        """Applies complete lines appended since the last poll (at most max_events); returns how many."""
+        try:
+            if os.path.getsize(self.path) < self.offset:
+                self.reset()
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+
+        applied = 0
+        start = 0
+        while max_events is None or applied < max_events:
+            end = data.find(b'\n', start)
+            if end < 0:
+                break
+            line = data[start:end].decode().strip()
+            start = end + 1
+            self.line_no += 1
+            if not line:
+                continue
+            try:
+                event = self._parse(line)
+                if event is not None:
+                    self.apply(event)
+                    applied += 1
+            except (ValueError, KeyError, TypeError) as e:
+                self.errors.append(f'line {self.line_no}: {e}')
+        self.offset += start
+        return applied
+
+    def _parse(self, line):
+        if not self.is_csv:
+            return json.loads(line)
+        row = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [h.strip() for h in row]
+            return None
+        return {k: v for k, v in zip(self.header, row) if v != ''}
+
+    def apply(self, event):
+        kind = event['event']
+        if kind not in EVENT_TYPES:
+            raise ValueError(f'unknown event {kind!r}; expected one of {EVENT_TYPES}')
+        bed = int(event['bed'])
+        if not 0 <= bed < self.physical_beds:
+            raise ValueError(f'bed {bed} is outside the ward (beds 0-{self.physical_beds - 1})')
+        t = _as_days(event.get('time'))
+        if t is not None:
+            self.clock = t if self.clock is None else max(self.clock, t)
+
+        if kind == 'discharge':
+            if bed not in self.beds:
+                raise ValueError(f'discharge from empty bed {bed}')
+            del self.beds[bed]
+        elif kind == 'admit':
+            if bed in self.beds:
+                raise ValueError(f'admission to occupied bed {bed}')
+            patient = {'cat': int(event.get('cat', 3)), 'days_remaining': float(event.get('days_remaining', 5)), 'since': t}
+            self.beds[bed] = patient
+            self.admitted.append((t, patient['cat']))
+        else:
+            if bed not in self.beds:
+                raise ValueError(f'update for empty bed {bed}')
+            patient = self.beds[bed]
+            if 'cat' in event:
+                patient['cat'] = int(event['cat'])
+            if 'days_remaining' in event:
+                patient['days_remaining'], patient['since'] = float(event['days_remaining']), t
+        self.n_events += 1
+
+    def ward(self):
+        """Occupied beds in bed order, as the current_ward list the engine takes."""
+        ward = []
+        for bed in sorted(self.beds):
+            p = self.beds[bed]
+            elapsed = self.clock - p['since'] if self.clock is not None and p['since'] is not None else 0.0
+            ward.append({'bed': bed, 'cat': p['cat'], 'days_remaining': max(0.0, p['days_remaining'] - elapsed)})
+        return ward
+
+    def snapshot(self):
+        """The live ward and the last seven days' admissions by category, for render_ward_ops."""
+        recent = [c for t, c in self.admitted if self.clock is None or t is None or t > self.clock - 7]
+        counts = np.bincount(recent, minlength=6)[1:6] if recent else np.zeros(5, dtype=int)
+        return {'ward_state': self.ward(), 'admissions': dict(zip(CATEGORIES, counts.tolist()))}
+
+def ward_profile(ward, weeks):
+    """Beds the given ward still holds in each logged week; all the forecast depends on.
+
+    Week 0 shows the ward as given; from then on a patient with d days remaining is gone
+    once the weekly discharge step has taken 7 days off it enough times to reach zero.
+    """
+    days = np.array([p.get('days_remaining', 5) for p in ward], dtype=np.float32)
+    profile = np.zeros(weeks, dtype=np.int64)
+    profile[0] = len(days)
+    for week in range(1, weeks):
+        # The same float32 steps as the engine's discharges, so rounding agrees exactly
+        days -= 7
+        days = days[days > 0]
+        profile[week] = len(days)
+    return profile
+
+class WardForecaster:
+    """A fixed set of CRN replications of one plan, kept in step with a changing ward.
+
+    Replication i always runs from the i-th child of SeedSequence(seed) with common random
+    numbers, so its backlog, referrals, deterioration and lengths of stay do not depend on
+    the ward. A ward change only shifts how many beds its own patients hold each week; a
+    replication where that never changes an admission or a cancellation (the ward had
+    spare beds beyond the theater slots either way, or the list was empty) is patched by
+    adding the shift to its occupancy. Only the others are rerun. With a ResultCache, a
+    ward profile seen before (in any process) is loaded instead of simulated.
+    """
+
+    def __init__(self, params, weeks=52, n_reps=50, seed=42, cache=None):
+        self.params = params
+        self.weeks = weeks
+        self.n_reps = n_reps
+        self.seed = seed
+        self.cache = cache
+        self.seeds = np.random.SeedSequence(seed).spawn(n_reps)
+        self.profile = None
+        self.runs = None
+        self.last = {'rerun': 0, 'patched': 0, 'seconds': 0.0, 'source': None}
+
+    def _key(self, profile):
+        return cache_key('ward_forecast', params=self.params, profile=profile.tolist(), weeks=self.weeks,
+                         n_reps=self.n_reps, seed=self.seed)
+
+    def _simulate(self, ward, reps):
+        for i in reps:
+            res = run_simulation(self.params, ward, weeks=self.weeks, seed=self.seeds[i], crn=True)
+            self.runs['backlog'][i] = res.backlog
+            self.runs['over_26'][i] = res.over_26
+            self.runs['occupancy'][i] = res.occupancy
+            self.runs['cancellations'][i] = res.cancellations
+            self.runs['admitted'][i] = res.admissions.sum(axis=1)
+            self.runs['det_events'][i] = res.det_events
+
+    def affected(self, profile):
+        """Replications whose admission decisions change if the ward's profile becomes `profile`."""
+        delta = profile - self.profile
+        eff_cap = self.params['total_beds'] - self.params['safety_buffer']
+        surg = self.params['surg_per_week']
+        # Beds taken just before each week's admissions, and the list they were admitted from
+        occupied = self.runs['occupancy'] - self.runs['admitted']
+        waiting = self.runs['backlog'].sum(axis=2) + self.runs['admitted']
+        before = np.minimum(np.maximum(0, eff_cap - occupied), surg)
+        after = np.minimum(np.maximum(0, eff_cap - occupied - delta), surg)
+        changed = (waiting > 0) & (before != after)
+        changed[:, 0] = False  # week 0 is logged as given, nothing is decided there
+        return changed.any(axis=1)
+
+    def update(self, ward):
+        """Brings the replications in line with `ward`; returns True if the forecast changed."""
+        profile = ward_profile(ward, self.weeks)
+        if self.profile is not None and np.array_equal(profile, self.profile):
+            return False
+        t0 = time.perf_counter()
+        key = self._key(profile)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            self.runs = {name: cached[name] for name in cached}
+            self.last = {'rerun': 0, 'patched': 0, 'source': 'cache'}
+        elif self.runs is None:
+            w, r = self.weeks, self.n_reps
+            self.runs = {'backlog': np.zeros((r, w, 5), dtype=np.int32), 'over_26': np.zeros((r, w), dtype=np.int32),
+                         'occupancy': np.zeros((r, w), dtype=np.int32), 'cancellations': np.zeros((r, w), dtype=np.int32),
+                         'admitted': np.zeros((r, w), dtype=np.int32), 'det_events': np.zeros((r, w), dtype=np.int32)}
+            self._simulate(ward, range(r))
+            self.last = {'rerun': r, 'patched': 0, 'source': 'simulated'}
+        else:
+            rerun = np.flatnonzero(self.affected(profile))
+            self.runs['occupancy'] += profile - self.profile
+            self._simulate(ward, rerun)
+            self.last = {'rerun': len(rerun), 'patched': self.n_reps - len(rerun), 'source': 'patched'}
+        if cached is None and self.cache is not None:
+            self.cache.put(key, self.runs)
+        self.profile = profile
+        self.last['seconds'] = time.perf_counter() - t0
+        return True
+
+    def to_frame(self):
+        """Per-week mean path (run_simulation's columns) plus StreamingSummary bands for the cloud."""
+        runs = self.runs
+        summary = StreamingSummary(self.weeks)
+        by_metric = {'Over_26_Wks': runs['over_26'], 'occupancy': runs['occupancy'], 'cancellations': runs['cancellations']}
+        summary.update(np.stack([by_metric[m] for m in SUMMARY_METRICS], axis=1))
+        df = summary.to_frame()
+        for j, cat in enumerate(CATEGORIES):
+            df[cat] = runs['backlog'][:, :, j].mean(axis=0)
+        df['Over_26_Wks'] = runs['over_26'].mean(axis=0)
+        df['occupancy'] = runs['occupancy'].mean(axis=0)
+        df['cancellations'] = runs['cancellations'].mean(axis=0)
+        df['det_events'] = runs['det_events'].mean(axis=0)
+        return df
+
+def main(argv=None):
+    from bench import REFERENCE
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('events', help='JSONL or CSV event log')
+    ap.add_argument('--follow', action='store_true', help='keep polling for appended events')
+    ap.add_argument('--per-poll', type=int, default=1, help='events applied per poll (0 for all available)')
+    ap.add_argument('--interval', type=float, default=0.0, help='seconds between polls')
+    ap.add_argument('--reps', type=int, default=50)
+    ap.add_argument('--target-week', type=int, default=26)
+    args = ap.parse_args(argv)
+
+    feed = WardFeed(args.events, REFERENCE['total_beds'])
+    forecaster = WardForecaster(REFERENCE, n_reps=args.reps)
+    while True:
+        n = feed.poll(args.per_poll or None)
+        if n and forecaster.update(feed.ward()):
+            df = forecaster.to_frame()
+            last = forecaster.last
+            print(f"{feed.n_events:5d} events  {len(feed.beds):3d} beds  rerun {last['rerun']:3d}/{args.reps}  "
+                  f"{last['seconds'] * 1e3:7.1f} ms  breach@{args.target_week}: "
+                  f"{df.loc[args.target_week, 'Over_26_Wks_breach']:.0%}", flush=True)
+        elif n:
+            print(f"{feed.n_events:5d} events  {len(feed.beds):3d} beds  forecast unchanged", flush=True)
+        elif not args.follow:
+            break
+        time.sleep(args.interval)
+    for err in feed.errors:
+        print('skipped', err)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import threading
+
+class Job:
+    """One background computation: its input key, future, latest partial result and stop flag.
+
+    version goes up whenever there is something new to show (a partial result or the end
+    of the job), which is what the page polls for.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.partial = None
+        self.version = 0
+        self.cancel_event = threading.Event()
+        # Bookkeeping for SimulationService: heavy-request flag, subscriber count, request hash
+        self.heavy = False
+        self.refs = 0
+        self.request = None
+
+    def publish(self, partial):
+        """Called from the worker with an intermediate result the page can show meanwhile."""
+        self.partial = partial
+        self.version += 1
+
+    def done(self):
+        return self.future.done()
+
+    def _finished(self, _future):
+        self.version += 1
+
+class JobRunner:
+    """Named background jobs for one session, run through the shared SimulationService.
+
+    Submitting a name again with the same key returns the running job; a different key
+    means the inputs changed, so the session lets go of the old job (the service cancels
+    it if no other session is waiting on it) and subscribes to the new one. The runner
+    remembers which version of each job the page last read, so changed() says when a
+    rerun would show something new.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.jobs = {}
+        self.seen = {}
+
+    def submit(self, name, key, fn, heavy=False):
+        """Runs fn(job) in the background under `name` unless the same key is already there.
+
+        Raises service.ServiceBusy if the service is at capacity; the old job is kept then.
+        """
+        job = self.jobs.get(name)
+        if job is not None and job.key == key:
+            return job
+        new = self.service.acquire(name, key, fn, heavy=heavy)
+        self.cancel(name)
+        self.jobs[name] = new
+        self.seen[name] = 0
+        return new
+
+    def get(self, name):
+        return self.jobs.get(name)
+
+    def latest(self, name):
+        """(result or latest partial, finished?) for the job under name; (None, False) if none."""
+        job = self.jobs.get(name)
+        if job is None:
+            return None, False
+        # Note the version before reading, so an update racing this read still counts as unseen
+        self.seen[name] = job.version
+        if job.done():
+            return job.future.result(), True  # a failed job re-raises its error here
+        return job.partial, False
+
+    def result(self, name):
+        """The finished result, or None while pending."""
+        value, finished = self.latest(name)
+        return value if finished else None
+
+    def cancel(self, name):
+        job = self.jobs.pop(name, None)
+        self.seen.pop(name, None)
+        if job is not None:
+            self.service.release(job)
+
+    def pending(self):
+        return [name for name, job in self.jobs.items() if not job.done()]
+
+    def changed(self):
+        """True if any job has published or finished since the page last read it."""
+        return any(job.version != self.seen.get(name) for name, job in self.jobs.items())
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from engine import BatchBacklog, BatchWard, _scenario_arrays
+
+NETWORK_COLUMNS = ['site', 'week', 'Cat 1', 'Cat 2', 'Cat 3', 'Cat 4', 'Cat 5', 'Over_26_Wks',
+                   'occupancy', 'cancellations', 'det_events', 'transfers_in', 'transfers_out']
+ROUTINGS = ('local', 'pooled', 'balanced')
+
+def _region_fill(region, amount, totals, order):
+    """Hands each region's total out to its sites in the given order, each up to its own amount."""
+    sorted_amount = amount[order]
+    sorted_region = region[order]
+    cum = np.cumsum(sorted_amount)
+    # Cumulative amount of earlier sites in the same region only
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_region)) + 1]
+    before = cum - sorted_amount - np.repeat(cum[starts] - sorted_amount[starts], np.diff(np.r_[starts, len(order)]))
+    share = np.zeros_like(amount)
+    share[order] = np.clip(totals[sorted_region] - before, 0, sorted_amount)
+    return share
+
+def run_network(params, sites, weeks=52, routing='local', overflow=True, max_transfers=None, seed=None):
+    """Simulates a regional network of cardiac units together, one row of stacked state per site.
+
+    params holds the shared clinical settings (deterioration, LOS, referral mix, legacy share);
+    sites is a DataFrame or list of dicts with each unit's total_beds, surg_per_week, weekly_refs
+    and total_backlog, plus optional safety_buffer, region and name. Every weekly phase of
+    run_simulation_batch runs as one NumPy step across all sites, so cost grows linearly with
+    the number of sites.
+
+    routing decides where the week's referrals go:
+      'local'     each unit treats its own referrals
+      'pooled'    a region's referrals are shared out in proportion to theater slots
+      'balanced'  as pooled, weighted away from units with long lists for their slots
+      (S x S) array  referrals raised at unit i go to unit j with probability [i, j]
+
+    With overflow=True, patients a unit had the slot but no bed for are transferred to units in
+    the same region with beds still free after their own admissions, most urgent first. A
+    transferred patient keeps the theater slot it lost at home, so a unit takes in at most its
+    own weekly slot count (and sends out at most max_transfers) per week. Returns a long DataFrame with one row per
+    (site, week) and NETWORK_COLUMNS.
+    """
+    sites = pd.DataFrame(sites).reset_index(drop=True)
+    n_sites = len(sites)
+    if n_sites == 0:
+        return pd.DataFrame(np.zeros((0, len(NETWORK_COLUMNS)), dtype=np.int64), columns=NETWORK_COLUMNS)
+    rng = np.random.default_rng(seed)
+    los_map, det_rates, cat_probs = _scenario_arrays(params)
+    rows = np.arange(n_sites)
+
+    beds = sites['total_beds'].to_numpy(dtype=np.int64)
+    eff_cap = np.maximum(0, beds - sites.get('safety_buffer', pd.Series(0, index=sites.index)).to_numpy(dtype=np.int64))
+    surg = sites['surg_per_week'].to_numpy(dtype=np.int64)
+    local_refs = sites['weekly_refs'].to_numpy(dtype=float)
+    total_bl = sites['total_backlog'].to_numpy(dtype=np.int64)
+    _, region = np.unique(sites['region'].to_numpy() if 'region' in sites else np.zeros(n_sites), return_inverse=True)
+    n_regions = region.max() + 1 if n_sites else 0
+    labels = sites['name'].to_numpy() if 'name' in sites else rows
+
+    if isinstance(routing, str):
+        if routing not in ROUTINGS:
+            raise ValueError(f"unknown routing {routing!r}; expected one of {ROUTINGS} or an (S x S) matrix")
+        routing_matrix = None
+    else:
+        routing_matrix = np.asarray(routing, dtype=float)
+        if routing_matrix.shape != (n_sites, n_sites):
+            raise ValueError(f"routing matrix must be ({n_sites} x {n_sites}), got {routing_matrix.shape}")
+        routing_matrix = routing_matrix / routing_matrix.sum(axis=1, keepdims=True)
+        # Poisson thinning: each unit's intake is Poisson with the routed share of every source's rate
+        routed_refs = local_refs @ routing_matrix
+    region_refs = np.bincount(region, local_refs, minlength=n_regions)
+
+    # --- 1. INITIALIZE BACKLOG: one row of the stacked lists per site ---
+    backlog = BatchBacklog(rng, total_bl, params.get('dist_legacy', 25) / 100, cat_probs)
+
+    # --- 2. WARDS: bed slots up to the largest unit; slots past a unit's own capacity never open ---
+    n_beds = int(eff_cap.max(initial=0))
+    ward = BatchWard(n_sites, n_beds, has_bed=np.arange(n_beds) < eff_cap[:, None])
+
+    new_legacy_pct = params.get('dist_legacy', 10) / 100
+    los_scale = params.get('los_scale', 1.0)
+    transfer_cap = np.full(n_sites, np.iinfo(np.int64).max) if max_transfers is None else np.full(n_sites, max_transfers)
+
+    out = np.zeros((weeks, n_sites, len(NETWORK_COLUMNS)), dtype=np.int64)
+    out[:, :, 0] = rows
+    out[:, :, 1] = np.arange(weeks)[:, None]
+    cancellations = np.zeros(n_sites, dtype=np.int64)
+    num_det = np.zeros(n_sites, dtype=np.int64)
+    transfers_in = np.zeros(n_sites, dtype=np.int64)
+    transfers_out = np.zeros(n_sites, dtype=np.int64)
+
+    # --- 3. WEEKLY LOOP: the phases of batch_arrays, plus routing and overflow ---
+    for week in range(weeks):
+        backlog.record(out[week])
+        out[week, :, 8] = ward.occupied.sum(axis=1)
+        out[week, :, 9] = cancellations
+        out[week, :, 10] = num_det
+        out[week, :, 11] = transfers_in
+        out[week, :, 12] = transfers_out
+
+        if week == weeks - 1:
+            break
+
+        # A-C) Aging, Legacy Breach, Clinical Deterioration
+        backlog.age()
+        num_det = backlog.deteriorate(rng, det_rates)
+
+        # D) New Referrals, routed to units by this week's rates
+        if routing_matrix is not None:
+            rates = routed_refs
+        elif routing == 'local':
+            rates = local_refs
+        else:
+            weight = surg.astype(float)
+            if routing == 'balanced':
+                weight = weight * surg / (surg + backlog.active)
+            region_weight = np.bincount(region, weight, minlength=n_regions)
+            share = np.divide(weight, region_weight[region], out=np.zeros(n_sites), where=region_weight[region] > 0)
+            rates = region_refs[region] * share
+        backlog.refer(rng, rng.poisson(rates), new_legacy_pct, cat_probs)
+
+        # E) Discharges
+        ward.discharge()
+
+        # F) Admissions: category first, then longest wait (slot index breaks ties)
+        avail = np.maximum(0, eff_cap - ward.occupied.sum(axis=1))
+        to_admit = np.minimum(np.minimum(avail, surg), backlog.active)
+        cancellations = np.where(backlog.active > 0, np.maximum(0, surg - avail), 0)
+        if to_admit.any():
+            ward.admit(rng, backlog.remove(backlog.select(to_admit)), to_admit, los_map, los_scale)
+            backlog.active -= to_admit
+
+        # G) Overflow: slots lost for want of a bed send their patients to units with a bed still free
+        transfers_in = np.zeros(n_sites, dtype=np.int64)
+        transfers_out = np.zeros(n_sites, dtype=np.int64)
+        if overflow and n_sites > 1:
+            demand = np.minimum(np.minimum(cancellations, backlog.active), transfer_cap)
+            spare = np.minimum(avail - to_admit, surg)
+            moved = np.minimum(np.bincount(region, demand, minlength=n_regions),
+                               np.bincount(region, spare, minlength=n_regions))
+            if moved.any():
+                # Donors with the most urgent head of the list go first; receivers with the most room
+                top, waited = backlog.head()
+                urgency = top * 65536 - waited
+                transfers_out = _region_fill(region, demand, moved, np.lexsort((urgency, region)))
+                transfers_in = _region_fill(region, spare, moved, np.lexsort((-spare, region)))
+                # Pair patients with receiving beds region by region, then seat them row by row
+                src_site, src_col = backlog.select(transfers_out)
+                dest = np.repeat(rows, transfers_in)
+                src_order = np.argsort(region[src_site], kind='stable')
+                dest_order = np.argsort(region[dest], kind='stable')
+                by_dest = np.argsort(dest[dest_order], kind='stable')
+                moving = (src_site[src_order][by_dest], src_col[src_order][by_dest])
+                ward.admit(rng, backlog.remove(moving), transfers_in, los_map, los_scale)
+                backlog.active -= transfers_out
+
+    frame = out.transpose(1, 0, 2).reshape(n_sites * weeks, len(NETWORK_COLUMNS))
+    df = pd.DataFrame(frame, columns=NETWORK_COLUMNS)
+    df['site'] = np.repeat(labels, weeks)
+    return df
@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from engine import BATCH_COLUMNS, batch_arrays
+
+def replication_pool(max_workers=None):
+    """Process pool for replication batches, one worker per core by default.
+
+    Workers are spawned, not forked, so the dashboard can start and share one from the
+    threads of its multi-threaded server.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count() or 1,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+def _run_block(params, current_ward, weeks, n_reps, seed_seq, columns):
+    """Worker task: one batch of replications as a (reps, columns, weeks) array."""
+    out = batch_arrays(params, current_ward, weeks=weeks, n_reps=n_reps, seed=seed_seq)
+    return np.ascontiguousarray(out[:, :, columns].transpose(1, 2, 0))
+
+def imap_blocks(params, current_ward, weeks, batches, columns, pool=None, lookahead=None):
+    """Yields the block of each (n_reps, seed_seq) batch, in batch order.
+
+    Without a pool the batches run one by one in this process. With one, up to lookahead
+    batches (default: one per core) run ahead of the consumer, so a caller that stops
+    early wastes at most that many; closing the generator cancels those not yet started.
+    The blocks are the same either way.
+    """
+    columns = [BATCH_COLUMNS.index(c) for c in columns]
+    if pool is None:
+        for n_reps, seed_seq in batches:
+            yield _run_block(params, current_ward, weeks, n_reps, seed_seq, columns)
+        return
+
+    lookahead = lookahead or os.cpu_count() or 1
+    batches = iter(batches)
+    running = []
+    try:
+        while True:
+            for n_reps, seed_seq in batches:
+                running.append(pool.submit(_run_block, params, current_ward, weeks, n_reps, seed_seq, columns))
+                if len(running) >= lookahead:
+                    break
+            if not running:
+                return
+            yield running.pop(0).result()
+    finally:
+        for future in running:
+            future.cancel()
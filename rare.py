@@ -0,0 +1,308 @@
+"""Rare-event estimate of the board's question: will anyone on the list breach 26 weeks?
+
+    python rare.py --slots 9 --beds 16                   # probability with a 95% CI
+    python rare.py --slots 9 --beds 16 --check 20000     # plus a plain Monte Carlo cross-check
+
+Under a well-resourced plan a breach after the stabilization week is rare, and plain Monte
+Carlo needs runs in proportion to 1/p to see any. Multilevel splitting instead follows the
+backlog-age trajectory: a score of how far the list is falling behind its oldest patients
+(see _Splitter). Each time a run's score first reaches the next level it is cloned into
+copies that continue independently, so effort concentrates on the runs heading for a
+breach. The probability is the product of the fractions that reach each level from the one
+before.
+
+A stage's runs are rows of the batched engine (engine.BatchBacklog/BatchWard), stepped
+together, so a run-week costs what it does in plain batched Monte Carlo. Splitting then
+breaks even with plain Monte Carlo around p = 1e-2 to 1e-3 and wins by far more below;
+every estimate times a batch of plain runs and reports the wall-time speedup.
+
+Levels come from a short adaptive pilot and are then fixed, so each repeat of the
+fixed-effort estimator is unbiased. The confidence interval is taken over independent
+repeats.
+"""
+import argparse
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from engine import BatchBacklog, BatchWard, _batch_week, _scenario_arrays, batch_arrays
+
+@dataclass
+class RareEventEstimate:
+    """P(someone has waited `threshold`+ weeks at some week of the window), from independent repeats."""
+    probability: float
+    std_error: float
+    ci: tuple
+    estimates: np.ndarray      # one unbiased estimate per repeat
+    levels: list               # score levels (see _Splitter), the last (1) being a breach
+    stage_probs: np.ndarray    # (repeats, levels) fraction of runs reaching each level from the last
+    weeks_simulated: int       # run-weeks across the repeats
+    pilot_weeks: int
+    window: tuple
+    seconds: float = 0.0
+    mc_seconds_per_run: float = np.nan  # wall time of one batched plain Monte Carlo run
+
+    @property
+    def naive_runs(self):
+        """Plain Monte Carlo runs needed for the same standard error."""
+        p = self.probability
+        return p * (1 - p) / self.std_error ** 2 if self.std_error > 0 else np.inf
+
+    @property
+    def mc_seconds(self):
+        """Wall time batched plain Monte Carlo would need for the same standard error."""
+        return self.naive_runs * self.mc_seconds_per_run
+
+    @property
+    def speedup(self):
+        """Plain Monte Carlo wall time over splitting's for this precision; below 1 when plain is cheaper."""
+        return self.mc_seconds / self.seconds if self.seconds else np.inf
+
+# Scores at or above this mean someone is in breach inside the window
+_BREACH = 10 ** 6
+
+class _Particles:
+    """A population of runs as rows of the batched engine's state, with each run's week and
+    highest score so far."""
+
+    def __init__(self, backlog, ward, week, best):
+        self.backlog = backlog
+        self.ward = ward
+        self.week = week
+        self.best = best
+
+    def __len__(self):
+        return len(self.week)
+
+    def take(self, rows):
+        return _Particles(self.backlog.take(rows), self.ward.take(rows), self.week[rows], self.best[rows])
+
+    @staticmethod
+    def concat(parts):
+        return _Particles(BatchBacklog.concat([p.backlog for p in parts]), BatchWard.concat([p.ward for p in parts]),
+                          np.concatenate([p.week for p in parts]), np.concatenate([p.best for p in parts]))
+
+class _Splitter:
+    """Advances particle populations week by week on the batched engine, every run one row.
+
+    Before the window the score is how far the list is behind the typical run: patients
+    who will have waited `threshold` weeks by the window start if not admitted, less the
+    pilot's mean of the same count at that week (`baseline`). Bed blocks and urgent
+    referrals taking the slots the oldest patients need push it up. Inside the window a
+    breach scores _BREACH or more, and no breach scores the (negative) weeks the longest
+    wait is short of the threshold, so the score first reaches _BREACH exactly at a breach.
+    """
+
+    def __init__(self, params, current_ward, window, threshold, rng, baseline=None):
+        self.params = params
+        self.current_ward = list(current_ward)
+        self.start, self.end = window
+        self.threshold = threshold
+        self.rng = rng
+        self.baseline = np.zeros(self.start) if baseline is None else baseline
+        self.arrays = _scenario_arrays(params)
+        self.weeks = 0  # run-weeks simulated
+
+    def at_risk(self, particles):
+        """Patients on each list who will be in breach at the window start unless admitted first."""
+        b = particles.backlog
+        due = self.threshold - (self.start - particles.week)
+        return ((b.wait >= due[:, None]) & (b.cat > 0)).sum(axis=1)
+
+    def score(self, particles):
+        b = particles.backlog
+        live = b.cat > 0
+        breached = ((b.wait >= self.threshold) & live).sum(axis=1)
+        inside = np.where(breached > 0, _BREACH + breached - 1, np.where(live, b.wait, 0).max(axis=1) - self.threshold)
+        before = particles.week < self.start
+        if not before.any():
+            return inside
+        ahead = self.at_risk(particles) - self.baseline[np.minimum(particles.week, self.start - 1)]
+        return np.where(before, np.minimum(ahead, _BREACH - 1), inside)
+
+    def fresh(self, n):
+        """n runs at week 0."""
+        params, (_, _, cat_probs) = self.params, self.arrays
+        backlog = BatchBacklog(self.rng, np.full(n, params.get('total_backlog', 60)),
+                               params.get('dist_legacy', 25) / 100, cat_probs)
+        eff_cap = params['total_beds'] - params['safety_buffer']
+        ward = BatchWard(n, max(len(self.current_ward), eff_cap, 0), self.current_ward)
+        particles = _Particles(backlog, ward, np.zeros(n, dtype=np.int64), np.zeros(n))
+        particles.best = self.score(particles).astype(float)
+        return particles
+
+    def step(self, particles):
+        _batch_week(particles.backlog, particles.ward, self.rng, self.params, *self.arrays)
+        particles.week += 1
+        self.weeks += len(particles)
+        np.maximum(particles.best, self.score(particles), out=particles.best)
+
+    def run(self, particles, level):
+        """Advances the runs until each reaches level or the window closes.
+
+        Returns (runs that reached it, as they were at the crossing; runs that did not, at the end).
+        """
+        hits, misses = [], []
+        while len(particles):
+            reached = particles.best >= level
+            over = ~reached & (particles.week >= self.end)
+            if reached.any() or over.any():
+                hits.append(particles.take(np.flatnonzero(reached)))
+                misses.append(particles.take(np.flatnonzero(over)))
+                particles = particles.take(np.flatnonzero(~reached & ~over))
+            if len(particles):
+                self.step(particles)
+        hits = [p for p in hits if len(p)]
+        misses = [p for p in misses if len(p)]
+        return (_Particles.concat(hits) if hits else None), (_Particles.concat(misses) if misses else None)
+
+    def split(self, hits, n):
+        """n runs from the hits: each cloned n // len(hits) times, the remainder to random hits."""
+        counts = np.full(len(hits), n // len(hits))
+        counts[self.rng.choice(len(hits), n % len(hits), replace=False)] += 1
+        return hits.take(np.repeat(np.arange(len(hits)), counts))
+
+def choose_levels(params, current_ward=(), window=(26, 51), n_particles=100, threshold=26, p0=0.2, seed=None):
+    """Adaptive pilot: the score baseline, then levels each at the (1 - p0) quantile of the highest
+    score runs reach from the last.
+
+    Returns (levels, baseline, run-weeks used); the last level is a breach. Each stage plays
+    copies of the runs to the end of the window to see how high they get, then runs them
+    again to the crossing of the chosen level for the next stage.
+    """
+    sim = _Splitter(params, current_ward, window, threshold, np.random.default_rng(seed))
+
+    # Mean at-risk count by week over plain runs up to the window start
+    probe = sim.fresh(n_particles)
+    at_risk = np.zeros((sim.start, n_particles))
+    for week in range(sim.start):
+        at_risk[week] = sim.at_risk(probe)
+        sim.step(probe)
+    sim.baseline = at_risk.mean(axis=1)
+    particles = sim.fresh(n_particles)
+
+    levels = []
+    while True:
+        _, ended = sim.run(particles.take(np.arange(len(particles))), np.inf)
+        maxima = ended.best
+        level = np.quantile(maxima, 1 - p0, method='higher')
+        if levels and level <= levels[-1]:
+            higher = maxima[maxima > levels[-1]]
+            if not len(higher):
+                break
+            level = higher.min()
+        if level >= _BREACH or (maxima >= _BREACH).mean() >= p0:
+            break
+        hits, _ = sim.run(particles, level)
+        if hits is None:
+            break
+        levels.append(float(level))
+        particles = sim.split(hits, n_particles)
+    return levels + [_BREACH], sim.baseline, sim.weeks
+
+def _fixed_effort(sim, levels, n_particles):
+    """One fixed-effort splitting estimate: the product of the per-level crossing fractions."""
+    particles = sim.fresh(n_particles)
+    stage_probs = np.zeros(len(levels))
+    for k, level in enumerate(levels):
+        hits, _ = sim.run(particles, level)
+        stage_probs[k] = (len(hits) if hits is not None else 0) / len(particles)
+        if hits is None or k == len(levels) - 1:
+            break
+        particles = sim.split(hits, n_particles)
+    return stage_probs.prod(), stage_probs
+
+def mc_seconds_per_run(params, current_ward=(), weeks=52, n_reps=512, seed=None):
+    """Wall seconds per run of plain Monte Carlo, timed on one batch of the batched engine."""
+    t0 = time.perf_counter()
+    batch_arrays(params, list(current_ward), weeks=weeks, n_reps=n_reps, seed=seed)
+    return (time.perf_counter() - t0) / n_reps
+
+def breach_probability(params, current_ward=(), weeks=52, start_week=26, threshold=26, n_particles=200,
+                       n_repeats=10, p0=0.2, seed=None, on_repeat=None, cancel=None, mc_reps=512):
+    """Estimates P(someone has waited `threshold`+ weeks at any week from start_week to the horizon).
+
+    That is Over_26_Wks > 0 in some week of the window, so start_week=target week asks
+    whether the plan stays stabilized once it gets there. Runs n_repeats independent
+    fixed-effort splitting estimates of n_particles each, on levels from choose_levels, and
+    returns a RareEventEstimate with a 95% normal confidence interval over the repeats; its
+    speedup compares wall time against batched plain Monte Carlo, timed on a batch of
+    mc_reps runs first (not counted in seconds). on_repeat(estimate) is called with the
+    estimate so far after each repeat; a set `cancel` event stops after the current one.
+    The window must hold at least two weeks: start_week < weeks - 1.
+    """
+    if not 0 <= start_week < weeks - 1:
+        raise ValueError(f"start_week {start_week} leaves no window before the horizon (weeks={weeks})")
+    seq = np.random.SeedSequence(seed)
+    pilot_seed, run_seed, mc_seed = seq.spawn(3)
+    mc_cost = mc_seconds_per_run(params, current_ward, weeks, mc_reps, mc_seed)
+    t0 = time.perf_counter()
+    window = (start_week, weeks - 1)
+    levels, baseline, pilot_weeks = choose_levels(params, current_ward, window, max(50, n_particles // 2),
+                                                  threshold, p0, pilot_seed)
+    sim = _Splitter(params, current_ward, window, threshold, np.random.default_rng(run_seed), baseline)
+
+    estimates, stages = [], []
+    for _ in range(n_repeats):
+        if cancel is not None and cancel.is_set():
+            break
+        p, stage_probs = _fixed_effort(sim, levels, n_particles)
+        estimates.append(p)
+        stages.append(stage_probs)
+        if on_repeat is not None:
+            on_repeat(_summarize(estimates, stages, levels, sim.weeks, pilot_weeks, window, time.perf_counter() - t0, mc_cost))
+    return _summarize(estimates, stages, levels, sim.weeks, pilot_weeks, window, time.perf_counter() - t0, mc_cost)
+
+def _summarize(estimates, stages, levels, weeks_simulated, pilot_weeks, window, seconds, mc_cost):
+    estimates = np.array(estimates)
+    p = estimates.mean() if len(estimates) else np.nan
+    se = estimates.std(ddof=1) / np.sqrt(len(estimates)) if len(estimates) > 1 else np.inf
+    return RareEventEstimate(probability=p, std_error=se, ci=(max(0.0, p - 1.96 * se), p + 1.96 * se),
+                             estimates=estimates, levels=list(levels), stage_probs=np.array(stages),
+                             weeks_simulated=weeks_simulated, pilot_weeks=pilot_weeks, window=window,
+                             seconds=seconds, mc_seconds_per_run=mc_cost)
+
+def main(argv=None):
+    from bench import REFERENCE
+    from engine import BATCH_COLUMNS
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--beds', type=int, default=None, help='total beds (default: the benchmark reference)')
+    ap.add_argument('--slots', type=int, default=None, help='theater slots per week')
+    ap.add_argument('--start-week', type=int, default=26)
+    ap.add_argument('--weeks', type=int, default=52)
+    ap.add_argument('--particles', type=int, default=200)
+    ap.add_argument('--repeats', type=int, default=10)
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--check', type=int, default=0, help='also run this many plain Monte Carlo replications')
+    args = ap.parse_args(argv)
+
+    params = dict(REFERENCE)
+    if args.beds is not None:
+        params['total_beds'] = args.beds
+    if args.slots is not None:
+        params['surg_per_week'] = args.slots
+    est = breach_probability(params, weeks=args.weeks, start_week=args.start_week, n_particles=args.particles,
+                             n_repeats=args.repeats, seed=args.seed,
+                             on_repeat=lambda e: print(f'repeat {len(e.estimates)}: {e.estimates[-1]:.3e}', flush=True))
+    print(f'\nP(breach in weeks {est.window[0]}-{est.window[1]}) = {est.probability:.3e}  '
+          f'95% CI [{est.ci[0]:.3e}, {est.ci[1]:.3e}]  ({est.seconds:.1f}s)')
+    print(f'levels {est.levels}, mean crossing fractions {np.round(est.stage_probs.mean(axis=0), 3).tolist()}')
+    if est.probability > 0 and np.isfinite(est.std_error):
+        print(f'{est.weeks_simulated + est.pilot_weeks:,} engine weeks; batched plain Monte Carlo would need '
+              f'~{est.naive_runs:,.0f} runs, ~{est.mc_seconds:,.1f}s, for this precision')
+        if est.speedup >= 1:
+            print(f'splitting was {est.speedup:,.1f}x faster')
+        else:
+            print(f'plain Monte Carlo would have been {1 / est.speedup:,.1f}x faster at this probability')
+
+    if args.check:
+        out = batch_arrays(params, [], weeks=args.weeks, n_reps=args.check, seed=args.seed)
+        hit = (out[args.start_week:, :, BATCH_COLUMNS.index('Over_26_Wks')] > 0).any(axis=0)
+        p = hit.mean()
+        se = np.sqrt(p * (1 - p) / args.check)
+        print(f'plain Monte Carlo, {args.check:,} runs: {p:.3e} +/- {1.96 * se:.1e}')
+
+if __name__ == '__main__':
+    main()
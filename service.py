@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import cache_key
+from jobs import Job
+
+class ServiceBusy(RuntimeError):
+    """Raised when the service turns a request away instead of queueing it."""
+
+class SimulationService:
+    """Process-wide engine pool shared by every dashboard session.
+
+    Work runs on a bounded thread pool. Identical requests (same kind and inputs) that are
+    already queued or running get the same Job back, so N managers waiting on the default
+    scenario share one computation. Admission control caps how much may be waiting at once,
+    with a tighter cap for heavy requests such as stress tests, so a burst of those cannot
+    starve everyone else. Each subscriber releases its job when done with it; a job nobody
+    is waiting on any more is cancelled. One that is already running keeps its worker until it
+    notices job.cancel_event, so it counts against the caps until its future completes.
+    """
+
+    def __init__(self, max_workers=4, max_pending=32, max_heavy=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='engine')
+        self.max_pending = max_pending
+        self.max_heavy = max_heavy
+        self._lock = threading.Lock()
+        self._inflight = {}  # request key -> Job
+        self._draining = set()  # released jobs still holding a worker
+        self.stats = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'completed': 0}
+
+    def acquire(self, kind, key, fn, heavy=False):
+        """Job computing fn(job) for (kind, key), joining an identical in-flight one if any."""
+        request = cache_key('request', job=kind, inputs=key)
+        with self._lock:
+            job = self._inflight.get(request)
+            if job is not None:
+                job.refs += 1
+                self.stats['coalesced'] += 1
+                return job
+            pending, heavy_pending = self._pending()
+            if pending >= self.max_pending or (heavy and heavy_pending >= self.max_heavy):
+                self.stats['rejected'] += 1
+                raise ServiceBusy(f'{heavy_pending} heavy and {pending} total requests already in flight')
+            job = Job(key)
+            job.heavy = heavy
+            job.refs = 1
+            job.request = request
+            self._inflight[request] = job
+            self.stats['submitted'] += 1
+            job.future = self.executor.submit(fn, job)
+        job.future.add_done_callback(job._finished)
+        job.future.add_done_callback(lambda _f: self._retire(job))
+        return job
+
+    def release(self, job):
+        """Drops one subscriber; the last one out cancels work nobody needs any more."""
+        with self._lock:
+            job.refs -= 1
+            if job.refs > 0:
+                return
+            if self._inflight.get(job.request) is job:
+                del self._inflight[job.request]
+        job.cancel_event.set()
+        # cancel() runs _retire itself when it succeeds, so it must be called without the lock
+        if not job.future.cancel():
+            with self._lock:
+                if not job.future.done():
+                    self._draining.add(job)
+
+    def _retire(self, job):
+        with self._lock:
+            if self._inflight.get(job.request) is job:
+                del self._inflight[job.request]
+            self._draining.discard(job)
+            if not job.future.cancelled():
+                self.stats['completed'] += 1
+
+    def _pending(self):
+        """(total, heavy) jobs holding or waiting for a worker; call with the lock held."""
+        jobs = [*self._inflight.values(), *self._draining]
+        return len(jobs), sum(j.heavy for j in jobs)
+
+    def has_room(self, heavy=False):
+        with self._lock:
+            pending, heavy_pending = self._pending()
+            return pending < self.max_pending and not (heavy and heavy_pending >= self.max_heavy)
+
+    def load(self):
+        """Snapshot of in-flight work for the Performance tab."""
+        with self._lock:
+            pending, heavy_pending = self._pending()
+            return {'in_flight': pending,
+                    'heavy_in_flight': heavy_pending,
+                    'draining': len(self._draining),
+                    'subscribers': sum(j.refs for j in self._inflight.values()),
+                    **self.stats}
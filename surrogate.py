@@ -0,0 +1,263 @@
+"""Fluid approximation of the weekly engine: expected backlog, beds and breaches in milliseconds.
+
+    python surrogate.py                  # error report against run_simulation_batch
+    python surrogate.py --designs 100    # ... over 100 scenarios from the sweep space
+
+Instead of sampling patients, fluid_simulation moves expected numbers of patients through
+the same weekly steps as run_simulation: the list is a mass over (legacy, category, weeks
+waited), deterioration and legacy escalation move fractions of it, and admissions take mass
+off the top in MDT order. Each week's admissions stay in a bed with the probability that a
+Gamma length of stay outlasts the weeks since, so occupancy is a convolution of admissions
+with those survival curves. Randomness only enters through its means, so the estimate is
+best where the ward is not saturated; error_report says how far off it is for a scenario.
+"""
+import argparse
+import functools
+import math
+import time
+
+import numpy as np
+
+from engine import CATEGORIES, _scenario_arrays, run_simulation_batch
+
+WAIT_BINS = 27  # weeks waited 0-25, then everyone at 26+ in the last bin
+
+def _gamma_sf(a, x):
+    """Regularized upper incomplete gamma Q(a, x) for one shape a > 0 and an array of x >= 0."""
+    x = np.asarray(x, dtype=float)
+    out = np.ones_like(x)
+    pos = x > 0
+    log_front = -x + a * np.log(np.where(pos, x, 1.0)) - math.lgamma(a)
+
+    # Series for P(a, x) below the mode, continued fraction for Q(a, x) above (Numerical Recipes 6.2)
+    lo = pos & (x < a + 1)
+    if lo.any():
+        xs = x[lo]
+        term = np.full(xs.shape, 1 / a)
+        total = term.copy()
+        for n in range(1, 500):
+            term = term * xs / (a + n)
+            total += term
+            if (term < total * 1e-13).all():
+                break
+        out[lo] = 1 - total * np.exp(log_front[lo])
+
+    hi = pos & ~lo
+    if hi.any():
+        xs = x[hi]
+        b = xs + 1 - a
+        c = np.full(xs.shape, 1e300)
+        d = 1 / b
+        h = d.copy()
+        for i in range(1, 500):
+            an = -i * (i - a)
+            b = b + 2
+            d = an * d + b
+            d = np.where(np.abs(d) < 1e-300, 1e-300, d)
+            c = b + an / c
+            c = np.where(np.abs(c) < 1e-300, 1e-300, c)
+            d = 1 / d
+            delta = d * c
+            h *= delta
+            if (np.abs(delta - 1) < 1e-13).all():
+                break
+        out[hi] = np.exp(log_front[hi]) * h
+    return np.clip(out, 0.0, 1.0)
+
+@functools.lru_cache(maxsize=256)
+def _survival_curves(shapes, scale, weeks):
+    surv = np.zeros((6, weeks))
+    surv[:, 0] = 1.0
+    days = 7.0 * np.arange(1, weeks)
+    for c, shape in enumerate(shapes, start=1):
+        if shape > 0 and scale > 0:
+            surv[c, 1:] = _gamma_sf(shape, days / scale)
+    surv.flags.writeable = False
+    return surv
+
+def stay_survival(params, weeks):
+    """(6, weeks) probability that a patient of each category is still in bed j weeks after admission.
+
+    A stay of max(1, Gamma(los_cat, los_scale)) days is logged in every week it has days left
+    at the top of, so j = 0 is certain and j >= 1 needs the stay to outlast 7j days. Curves
+    are cached per LOS setting, since the optimizer reuses them for every bed/slot candidate.
+    """
+    los_map, _, _ = _scenario_arrays(params)
+    return _survival_curves(tuple(float(a) for a in los_map[1:]), float(params.get('los_scale', 1.0)), weeks)
+
+def _initial_mass(params, cat_probs):
+    """Expected starting list as a (2, 5, WAIT_BINS) mass over (legacy, category, weeks waited)."""
+    mass = np.zeros((2, 5, WAIT_BINS))
+    total_bl = params.get('total_backlog', 60)
+    n_legacy = min(total_bl * params.get('dist_legacy', 25) / 100, total_bl)
+    # Legacy cohort waits uniformly 1-24 weeks as Cat 5, the rest 0-24 weeks across the referral mix
+    mass[1, 4, 1:25] = n_legacy / 24
+    mass[0, :, 0:25] = (total_bl - n_legacy) * np.asarray(cat_probs)[:, None] / 25
+    return mass
+
+def _referral_mass(params, cat_probs):
+    """Expected mass one week of referrals adds, arriving with Poisson(2) weeks already waited."""
+    w = np.arange(WAIT_BINS)
+    wait_pmf = np.exp(-2.0 + w * math.log(2.0) - np.array([math.lgamma(k + 1) for k in w]))
+    wait_pmf[-1] = max(0.0, 1 - wait_pmf[:-1].sum())  # Poisson(2) tail at 26+ weeks
+    refs = params['weekly_refs']
+    special = params.get('dist_legacy', 10) / 100
+    mass = np.zeros((2, 5, WAIT_BINS))
+    mass[0] = (1 - special) * refs * np.outer(cat_probs, wait_pmf)
+    mass[1] = special * refs * np.outer(cat_probs, wait_pmf)
+    # Special referrals already past 26 weeks arrive straight into Cat 1
+    mass[1, 0, -1] = special * refs * wait_pmf[-1]
+    mass[1, 1:, -1] = 0.0
+    return mass
+
+def _fluid_run(params, current_ward, weeks):
+    """(weeks, 10) array of week, Cat 1-5, Over_26_Wks, occupancy, cancellations, det_events."""
+    los_map, det_rates, cat_probs = _scenario_arrays(params)
+    eff_cap = params['total_beds'] - params['safety_buffer']
+    surg = params['surg_per_week']
+    surv = stay_survival(params, weeks)
+
+    mass = _initial_mass(params, cat_probs)
+    arrivals = _referral_mass(params, cat_probs)
+    initial_days = np.array([p.get('days_remaining', 5) for p in current_ward], dtype=float)
+    ward_left = (initial_days[None, :] - 7.0 * np.arange(weeks)[:, None] > 0).sum(axis=1)
+    admitted = np.zeros((weeks, 6))
+
+    out = np.zeros((weeks, 10))
+    cancellations = det = 0.0
+    for week in range(weeks):
+        # Log the top of the week, as run_simulation does
+        counts = mass.sum(axis=(0, 2))
+        over_26 = mass[:, :, -1].sum()
+        occupancy = ward_left[week] + (admitted[:week + 1] * surv[:, week::-1].T).sum()
+        out[week] = [week, *counts, over_26, occupancy, cancellations, det if week else 0.0]
+        if week == weeks - 1:
+            break
+
+        backlog = mass.sum()
+        if backlog > 0:
+            # A) Aging: everyone moves one wait bin on, 26+ stays put
+            mass[:, :, -1] += mass[:, :, -2]
+            mass[:, :, 1:-1] = mass[:, :, :-2].copy()
+            mass[:, :, 0] = 0.0
+
+            # B) Legacy Breach
+            mass[1, 0, -1] += mass[1, 1:, -1].sum()
+            mass[1, 1:, -1] = 0.0
+
+            # C) Clinical Deterioration: expected events spread evenly over Cat 2-5
+            det = (mass[0, 1:].sum(axis=1) * det_rates[2:]).sum()
+            upgradable = mass[:, 1:].sum()
+            if upgradable > 0:
+                moved = mass[:, 1:] * min(1.0, det / upgradable)
+                mass[:, 1:] -= moved
+                mass[:, :-1] += moved
+        else:
+            det = 0.0
+
+        # D) New Referrals
+        mass += arrivals
+
+        # E) Discharges, F) Admissions: expected free beds, then the top of the list in MDT order
+        next_week = week + 1
+        occupied = ward_left[next_week] + (admitted[:next_week] * surv[:, next_week:0:-1].T).sum()
+        avail = max(0.0, eff_cap - occupied)
+        backlog = mass.sum()
+        to_admit = min(avail, surg, backlog)
+        cancellations = max(0.0, surg - avail) if backlog > 0 else 0.0
+        # Category first, longest wait first within it: order the bins as (category, -wait, legacy)
+        ordered = mass[:, :, ::-1].transpose(1, 2, 0)
+        flat = ordered.ravel()
+        taken = np.minimum(flat, np.maximum(0.0, to_admit - (np.cumsum(flat) - flat))).reshape(ordered.shape)
+        mass -= taken.transpose(2, 0, 1)[:, :, ::-1]
+        admitted[next_week, 1:] = taken.sum(axis=(1, 2))
+
+    return out
+
+def fluid_simulation(params, current_ward, weeks=52):
+    """Expected-value run of the weekly engine; same columns as run_simulation's frame.
+
+    Values are expected counts (floats), plus 'breach_prob', the chance that someone has
+    waited 26+ weeks by that week if breaches arrive as a Poisson count.
+    """
+    import pandas as pd
+
+    out = _fluid_run(params, current_ward, weeks)
+    df = pd.DataFrame(out, columns=['week', *CATEGORIES, 'Over_26_Wks', 'occupancy', 'cancellations', 'det_events'])
+    df['week'] = df['week'].astype(int)
+    df['breach_prob'] = 1 - np.exp(-df['Over_26_Wks'])
+    return df
+
+def fluid_over_26(params, target_wk):
+    """Expected patients waiting 26+ weeks at target_wk with an empty starting ward."""
+    return _fluid_run(params, [], target_wk + 1)[target_wk, 6]
+
+def error_report(params, current_ward=(), weeks=52, target_week=26, n_reps=200, seed=0):
+    """Fluid estimate vs the mean of n_reps simulated replications, for the headline metrics.
+
+    Returns a DataFrame with one row per metric: estimate, simulated mean, its standard
+    error, and the absolute and relative error.
+    """
+    import pandas as pd
+
+    fluid = fluid_simulation(params, list(current_ward), weeks)
+    sim = run_simulation_batch(params, list(current_ward), weeks=weeks, n_reps=n_reps, seed=seed)
+    per_rep = sim.groupby('rep').agg(cancellations=('cancellations', 'sum'), occupancy=('occupancy', 'mean'))
+    at_target = sim.loc[sim['week'] == target_week, 'Over_26_Wks'].to_numpy()
+    backlog_end = sim.loc[sim['week'] == weeks - 1, CATEGORIES].sum(axis=1).to_numpy()
+    simulated = {
+        'occupancy': per_rep['occupancy'].to_numpy(),
+        'cancellations': per_rep['cancellations'].to_numpy(),
+        'over_26_at_target': at_target,
+        'breach_prob_at_target': (at_target > 0).astype(float),
+        'backlog_end': backlog_end,
+    }
+    estimate = {
+        'occupancy': fluid['occupancy'].mean(),
+        'cancellations': fluid['cancellations'].sum(),
+        'over_26_at_target': fluid.loc[target_week, 'Over_26_Wks'],
+        'breach_prob_at_target': fluid.loc[target_week, 'breach_prob'],
+        'backlog_end': fluid.loc[weeks - 1, CATEGORIES].sum(),
+    }
+    rows = []
+    for metric, values in simulated.items():
+        mean = values.mean()
+        rows.append({'metric': metric, 'estimate': estimate[metric], 'simulated': mean,
+                     'sim_se': values.std(ddof=1) / math.sqrt(len(values)),
+                     'abs_error': estimate[metric] - mean,
+                     'rel_error': (estimate[metric] - mean) / abs(mean) if mean else np.nan})
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    import pandas as pd
+
+    from bench import REFERENCE
+    from sweep import SWEEP_SPACE, sample_designs
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--designs', type=int, default=0, help='also score this many scenarios from the sweep space')
+    ap.add_argument('--reps', type=int, default=200)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    fluid_simulation(REFERENCE, [])
+    print(f"fluid_simulation: {(time.perf_counter() - t0) * 1e3:.1f} ms for 52 weeks\n")
+    print("Reference scenario:")
+    print(error_report(REFERENCE, n_reps=args.reps, seed=args.seed).to_string(index=False, float_format='%.3f'))
+
+    if args.designs:
+        reports = []
+        for i, row in enumerate(sample_designs(args.designs, seed=args.seed)):
+            params = {**REFERENCE, **dict(zip(SWEEP_SPACE, row.tolist()))}
+            reports.append(error_report(params, n_reps=args.reps, seed=i).assign(design=i))
+        errors = pd.concat(reports)
+        errors['abs_error'] = errors['abs_error'].abs()
+        summary = errors.groupby('metric').agg(mean_abs_error=('abs_error', 'mean'),
+                                               p90_abs_error=('abs_error', lambda e: e.quantile(0.9)),
+                                               mean_simulated=('simulated', 'mean'))
+        print(f"\nAcross {args.designs} scenarios from the sweep space:")
+        print(summary.to_string(float_format='%.3f'))
+
+if __name__ == '__main__':
+    main()
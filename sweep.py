@@ -0,0 +1,236 @@
+"""Global sensitivity sweep: which clinical inputs actually drive breach risk.
+
+    python sweep.py sweeps/demo --designs 50000 --workers 8     # start or resume
+    python sweep.py sweeps/demo --report                        # sensitivity indices so far
+
+Designs are drawn over SWEEP_SPACE (Latin hypercube, or Sobol when SciPy is installed),
+run in chunks across a process pool, and each design's summary metrics are written into
+one memory-mapped .npy column per metric. A chunk is marked done only after its rows are
+flushed, so an interrupted sweep resumes from the first unfinished chunk.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from engine import run_simulation_batch
+
+# Swept inputs and their ranges (the sidebar limits where the app has a slider)
+SWEEP_SPACE = {
+    'det_5to4': (0.0, 0.1), 'det_4to3': (0.0, 0.1), 'det_3to2': (0.0, 0.2), 'det_2to1': (0.0, 0.3),
+    'los_cat1': (11, 33), 'los_cat2': (5, 17), 'los_cat3': (2, 8), 'los_cat4': (1, 4), 'los_cat5': (1, 4),
+    'los_scale': (0.5, 2.0), 'weekly_refs': (1, 15), 'dist_legacy': (0, 100),
+}
+SWEEP_METRICS = ('over_26_mean', 'breach_prob', 'cancellations', 'occupancy', 'backlog_end')
+
+def sample_designs(n, space=SWEEP_SPACE, method='lhs', seed=0):
+    """(n, len(space)) design matrix scaled to the ranges in space."""
+    d = len(space)
+    if method == 'sobol':
+        from scipy.stats import qmc  # optional: only Sobol designs need SciPy
+        unit = qmc.Sobol(d, scramble=True, seed=seed).random(n)
+    elif method == 'lhs':
+        # One point per stratum in every dimension, strata paired up by independent permutations
+        rng = np.random.default_rng(seed)
+        unit = (rng.permuted(np.tile(np.arange(n), (d, 1)), axis=1).T + rng.random((n, d))) / n
+    else:
+        raise ValueError(f"unknown sampling method {method!r}")
+    low, high = np.array(list(space.values()), dtype=float).T
+    return low + unit * (high - low)
+
+class SweepStore:
+    """On-disk sweep: meta.json, designs.npy, one <metric>.npy column each, and chunk markers.
+
+    Every array is opened as a memmap, so readers page in only what they touch and worker
+    processes write their own rows in place.
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.params = list(self.meta['space'])
+        self.designs = np.load(os.path.join(path, 'designs.npy'), mmap_mode=mode)
+        self.metrics = {m: np.load(os.path.join(path, f'{m}.npy'), mmap_mode=mode) for m in self.meta['metrics']}
+
+    @classmethod
+    def create(cls, path, base_params, n_designs, space=SWEEP_SPACE, chunk_size=250, n_reps=8,
+               weeks=52, target_week=26, method='lhs', seed=0):
+        os.makedirs(os.path.join(path, 'done'), exist_ok=True)
+        designs = np.lib.format.open_memmap(os.path.join(path, 'designs.npy'), mode='w+',
+                                            dtype=np.float64, shape=(n_designs, len(space)))
+        designs[:] = sample_designs(n_designs, space, method, seed)
+        designs.flush()
+        for m in SWEEP_METRICS:
+            col = np.lib.format.open_memmap(os.path.join(path, f'{m}.npy'), mode='w+', dtype=np.float32, shape=(n_designs,))
+            col[:] = np.nan
+            col.flush()
+        meta = {'base_params': base_params, 'space': {k: list(v) for k, v in space.items()},
+                'metrics': list(SWEEP_METRICS), 'n_designs': n_designs, 'chunk_size': chunk_size,
+                'n_reps': n_reps, 'weeks': weeks, 'target_week': target_week, 'method': method, 'seed': seed}
+        # meta.json goes last: a directory without it is an unfinished create, not a sweep
+        tmp = os.path.join(path, 'meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, os.path.join(path, 'meta.json'))
+        return cls(path)
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, 'meta.json'))
+
+    @property
+    def n_chunks(self):
+        return -(-self.meta['n_designs'] // self.meta['chunk_size'])
+
+    def chunk_rows(self, i):
+        size = self.meta['chunk_size']
+        return slice(i * size, min((i + 1) * size, self.meta['n_designs']))
+
+    def _marker(self, i):
+        return os.path.join(self.path, 'done', f'{i:06d}')
+
+    def pending_chunks(self):
+        return [i for i in range(self.n_chunks) if not os.path.exists(self._marker(i))]
+
+    def mark_done(self, i):
+        open(self._marker(i), 'w').close()
+
+    def completed(self):
+        """Boolean mask of designs whose metrics have been written."""
+        return ~np.isnan(self.metrics[self.meta['metrics'][0]])
+
+    def design_params(self, row):
+        return {**self.meta['base_params'], **dict(zip(self.params, self.designs[row].tolist()))}
+
+def _design_metrics(params, n_reps, weeks, target_week, seed):
+    df = run_simulation_batch(params, [], weeks=weeks, n_reps=n_reps, seed=seed)
+    at_target = df.loc[df['week'] == target_week, 'Over_26_Wks'].to_numpy()
+    last = df[df['week'] == weeks - 1]
+    return {
+        'over_26_mean': at_target.mean(),
+        'breach_prob': (at_target > 0).mean(),
+        'cancellations': df['cancellations'].sum() / n_reps,
+        'occupancy': df['occupancy'].mean(),
+        'backlog_end': last[['Cat 1', 'Cat 2', 'Cat 3', 'Cat 4', 'Cat 5']].to_numpy().sum(axis=1).mean(),
+    }
+
+def _run_chunk(path, i):
+    """Worker task: simulate one chunk of designs and write its rows straight into the store."""
+    store = SweepStore(path, mode='r+')
+    meta = store.meta
+    rows = store.chunk_rows(i)
+    seeds = np.random.SeedSequence(meta['seed']).spawn(store.n_chunks)[i].spawn(rows.stop - rows.start)
+    for row, seed in zip(range(rows.start, rows.stop), seeds):
+        values = _design_metrics(store.design_params(row), meta['n_reps'], meta['weeks'], meta['target_week'], seed)
+        for m, v in values.items():
+            store.metrics[m][row] = v
+    for col in store.metrics.values():
+        col.flush()
+    store.mark_done(i)
+    return i
+
+def _init_worker(niceness):
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+def run_sweep(path, base_params=None, n_designs=1000, max_workers=None, on_chunk=None, cancel=None,
+              niceness=0, **options):
+    """Creates the store at path if needed, then runs every unfinished chunk across a process pool.
+
+    max_workers=0 runs the chunks in the calling process instead. niceness lowers the
+    workers' CPU priority so a background sweep yields to interactive work. options
+    (chunk_size, n_reps, weeks, target_week, method, seed) only apply when the store is
+    created. on_chunk(done, total) reports progress; a set `cancel` event stops the sweep
+    after the chunks already running, leaving it resumable. Returns the store.
+    """
+    if not SweepStore.exists(path):
+        SweepStore.create(path, base_params, n_designs, **options)
+    store = SweepStore(path)
+    pending = store.pending_chunks()
+    done = store.n_chunks - len(pending)
+    if max_workers == 0:
+        for i in pending:
+            if cancel is not None and cancel.is_set():
+                break
+            _run_chunk(path, i)
+            done += 1
+            if on_chunk is not None:
+                on_chunk(done, store.n_chunks)
+        return SweepStore(path)
+
+    # spawn, not fork: the dashboard starts sweeps from a thread of a multi-threaded server
+    workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(niceness,)) as pool:
+        futures = [pool.submit(_run_chunk, path, i) for i in pending]
+        for future in as_completed(futures):
+            future.result()
+            done += 1
+            if on_chunk is not None:
+                on_chunk(done, store.n_chunks)
+            if cancel is not None and cancel.is_set():
+                pool.shutdown(cancel_futures=True)
+                break
+    return SweepStore(path)
+
+def sensitivity_indices(store, metric='over_26_mean', bins=20):
+    """First-order sensitivity of metric to each swept input, from the designs finished so far.
+
+    'first_order' is the correlation ratio Var(E[Y | X_i]) / Var(Y), estimated by binning
+    X_i into equal-count bins and corrected for the spread the bin means show by chance
+    alone; it needs no special design, so partial and resumed sweeps work. 'spearman'
+    gives the direction of the effect.
+    """
+    mask = store.completed()
+    y = np.asarray(store.metrics[metric][mask], dtype=float)
+    X = np.asarray(store.designs[mask])
+    rows = []
+    var_y = y.var()
+    n_bins = max(1, min(bins, len(y) // 10))
+    y_rank = y.argsort().argsort()
+    for j, name in enumerate(store.params):
+        x = X[:, j]
+        order = x.argsort()
+        groups = np.array_split(y[order], n_bins)
+        means = np.array([g.mean() for g in groups])
+        sizes = np.array([len(g) for g in groups])
+        eta2 = (sizes * (means - y.mean()) ** 2).sum() / len(y) / var_y if var_y > 0 else 0.0
+        first = max(0.0, 1 - (1 - eta2) * (len(y) - 1) / max(len(y) - n_bins, 1)) if n_bins > 1 else 0.0
+        spearman = np.corrcoef(order.argsort(), y_rank)[0, 1] if var_y > 0 else 0.0
+        rows.append({'parameter': name, 'first_order': first, 'spearman': spearman})
+    df = pd.DataFrame(rows).sort_values('first_order', ascending=False, ignore_index=True)
+    df.attrs['n_designs'] = int(mask.sum())
+    return df
+
+def main(argv=None):
+    from bench import REFERENCE
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('path', help='store directory (created on first run, resumed afterwards)')
+    ap.add_argument('--designs', type=int, default=1000)
+    ap.add_argument('--reps', type=int, default=8, help='replications per design')
+    ap.add_argument('--chunk-size', type=int, default=250)
+    ap.add_argument('--method', choices=['lhs', 'sobol'], default='lhs')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--workers', type=int, default=None)
+    ap.add_argument('--metric', default='over_26_mean', choices=SWEEP_METRICS)
+    ap.add_argument('--report', action='store_true', help='only print indices from what is stored')
+    args = ap.parse_args(argv)
+
+    if not args.report:
+        store = run_sweep(args.path, REFERENCE, args.designs, max_workers=args.workers,
+                          on_chunk=lambda done, total: print(f'chunk {done}/{total}', flush=True),
+                          chunk_size=args.chunk_size, n_reps=args.reps, method=args.method, seed=args.seed)
+    else:
+        store = SweepStore(args.path)
+    df = sensitivity_indices(store, args.metric)
+    print(f"\n{args.metric}: {df.attrs['n_designs']} designs")
+    print(df.to_string(index=False, float_format='%.3f'))
+
+if __name__ == '__main__':
+    main()
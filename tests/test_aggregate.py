@@ -0,0 +1,14 @@
+import numpy as np
+import pytest
+
+from aggregate import stream_replications
+from bench import REFERENCE
+
+def test_target_week_must_be_simulated():
+    with pytest.raises(ValueError):
+        stream_replications(REFERENCE, [], weeks=52, target_week=52)
+
+def test_target_week_at_horizon_runs_with_longer_horizon():
+    summary = stream_replications(REFERENCE, [], weeks=53, target_week=52, tol=np.inf, min_reps=50, seed=0)
+    assert summary.n == 50
+    assert np.isfinite(summary.ci_halfwidth('Over_26_Wks', 52))
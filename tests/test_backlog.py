@@ -0,0 +1,54 @@
+import numpy as np
+
+from engine import PriorityBacklog
+
+def _filled(rng, weeks=40):
+    """A list built over several weeks, with a legacy share, plus the born week of every uid."""
+    backlog, born = PriorityBacklog(), {}
+    for _ in range(weeks):
+        n = int(rng.integers(0, 30))
+        cats = rng.integers(1, 6, n)
+        waits = rng.integers(0, 5, n)
+        first = backlog.next_uid
+        backlog.add(cats, waits, rng.random(n) < 0.3)
+        born.update(zip(range(first, first + n), (backlog.week - waits).tolist()))
+        backlog.age()
+        backlog.escalate_legacy()
+    return backlog, born
+
+def _reference(backlog, born):
+    """(category, -wait) order of everyone waiting, from bucket membership alone."""
+    waiting = [(c, born[u]) for c in range(1, 6) for u in backlog.buckets[c].view()[2].tolist()]
+    return sorted(waiting)
+
+def test_admission_order_is_category_then_longest_wait():
+    rng = np.random.default_rng(3)
+    backlog, born = _filled(rng)
+    expected = _reference(backlog, born)
+    assert len({c for c, _ in expected}) == 5 and len({b for _, b in expected}) > 20
+
+    admitted = []
+    while len(backlog):
+        cats, uids = backlog.pop(int(rng.integers(1, 12)))
+        admitted += [(int(c), born[u]) for c, u in zip(cats, uids.tolist())]
+        if len(backlog):
+            c, b = backlog.peek()
+            assert backlog.pop_next() == (c, b)
+            admitted.append((c, b))
+    assert admitted == expected
+
+def test_order_holds_after_escalation_and_deterioration():
+    rng = np.random.default_rng(4)
+    backlog, born = _filled(rng)
+    for _ in range(10):
+        backlog.deteriorate(int(rng.integers(0, 40)), rng)
+        backlog.age()
+        backlog.escalate_legacy()
+    # Legacy patients past 26 weeks have all been escalated
+    for c in range(2, 6):
+        b, legacy, _ = backlog.buckets[c].view()
+        assert not (legacy & (backlog.week - b >= 26)).any()
+
+    expected = _reference(backlog, born)
+    cats, uids = backlog.pop(len(backlog))
+    assert [(int(c), born[u]) for c, u in zip(cats, uids.tolist())] == expected
@@ -0,0 +1,49 @@
+import numpy as np
+
+from bench import REFERENCE
+from engine import BatchBacklog, BatchWard, _batch_week, _row_bincount, _sample_ranks, _scenario_arrays
+
+def _advanced(n_rows=40, weeks=30, seed=0, **overrides):
+    params = {**REFERENCE, **overrides}
+    rng = np.random.default_rng(seed)
+    los_map, det_rates, cat_probs = _scenario_arrays(params)
+    backlog = BatchBacklog(rng, np.full(n_rows, params['total_backlog']), 0.25, cat_probs)
+    ward = BatchWard(n_rows, params['total_beds'])
+    for _ in range(weeks):
+        _batch_week(backlog, ward, rng, params, los_map, det_rates, cat_probs)
+    return backlog
+
+def test_counts_track_the_arrays():
+    backlog = _advanced(total_backlog=300, surg_per_week=4)
+    counts = _row_bincount(backlog.cat, len(backlog), 6)
+    legacy_counts = _row_bincount(np.where(backlog.legacy, backlog.cat, 0), len(backlog), 6)
+    np.testing.assert_array_equal(backlog.counts[:, 1:], counts[:, 1:])
+    np.testing.assert_array_equal(backlog.legacy_counts[:, 1:], legacy_counts[:, 1:])
+    np.testing.assert_array_equal(backlog.active, counts[:, 1:].sum(axis=1))
+
+def test_select_follows_admission_order():
+    backlog = _advanced(total_backlog=200)
+    k = np.random.default_rng(1).integers(0, 40, size=len(backlog))
+    rows, cols = backlog.select(k)
+    for r in range(len(backlog)):
+        live = np.flatnonzero(backlog.cat[r] > 0)
+        # Reference: sort on (category, -wait, slot)
+        order = live[np.lexsort((live, -backlog.wait[r, live].astype(int), backlog.cat[r, live]))]
+        np.testing.assert_array_equal(np.sort(cols[rows == r]), np.sort(order[:min(k[r], len(live))]))
+
+def test_sample_ranks_draws_distinct_ranks_per_row():
+    rng = np.random.default_rng(0)
+    n = np.array([0, 1, 4, 10, 500, 3000])
+    k = np.array([0, 1, 3, 4, 20, 1500])
+    offset = np.cumsum(n) - n
+    hits = np.zeros(n.sum())
+    for _ in range(500):
+        picks = _sample_ranks(rng, n, k)
+        assert len(np.unique(picks)) == len(picks)
+        np.testing.assert_array_equal(np.bincount(np.searchsorted(offset, picks, side='right') - 1, minlength=len(n)), k)
+        hits[picks] += 1
+    # Every rank of a row is equally likely
+    for r in np.flatnonzero(n):
+        share = hits[offset[r]:offset[r] + n[r]] / 500
+        assert abs(share.mean() - k[r] / n[r]) < 1e-9
+        assert np.abs(share - k[r] / n[r]).max() < 0.12
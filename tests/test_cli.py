@@ -0,0 +1,31 @@
+import json
+import os
+
+import pytest
+
+from cli import load_scenarios, main
+
+PARAMS = {'total_beds': 16, 'safety_buffer': 1, 'surg_per_week': 10, 'weekly_refs': 9, 'total_backlog': 40}
+
+def _write(tmp_path, names):
+    path = tmp_path / 'scenarios.json'
+    path.write_text(json.dumps({'defaults': PARAMS, 'scenarios': [{'name': n} for n in names]}))
+    return str(path)
+
+@pytest.mark.parametrize('name', ['../escaped', '/tmp/escaped', 'a/b', 'a\\b', '', 'two words', 7])
+def test_names_that_are_not_plain_file_names_are_rejected(tmp_path, name):
+    with pytest.raises(ValueError):
+        load_scenarios(_write(tmp_path, [name]))
+
+def test_plain_names_are_kept(tmp_path):
+    assert [s['name'] for s in load_scenarios(_write(tmp_path, ['base', 'winter-2026_v1.2']))] == \
+        ['base', 'winter-2026_v1.2']
+
+def test_npz_output_stays_under_out(tmp_path):
+    out = tmp_path / 'out'
+    with pytest.raises(SystemExit):
+        main([_write(tmp_path, ['../escaped']), '--out', str(out), '--format', 'npz', '--workers', '0'])
+    assert not (tmp_path / 'escaped.npz').exists()
+
+    assert main([_write(tmp_path, ['base']), '--out', str(out), '--format', 'npz', '--workers', '0']) == 0
+    assert sorted(os.listdir(out)) == ['base.npz', 'manifest.jsonl']
@@ -0,0 +1,27 @@
+import pytest
+
+from feed import WardFeed
+from visuals import _floor_map_html
+
+def test_beds_outside_the_ward_are_rejected(tmp_path):
+    feed = WardFeed(str(tmp_path / 'events.jsonl'), physical_beds=4)
+    for bed in (-1, 4):
+        with pytest.raises(ValueError):
+            feed.apply({'event': 'admit', 'bed': bed, 'cat': 2})
+    assert feed.beds == {}
+
+def test_poll_skips_a_bed_outside_the_ward(tmp_path):
+    path = tmp_path / 'events.jsonl'
+    path.write_text('{"event": "admit", "bed": 0, "cat": 2}\n{"event": "admit", "bed": 9, "cat": 3}\n')
+    feed = WardFeed(str(path), physical_beds=4)
+    assert feed.poll() == 1
+    assert list(feed.beds) == [0] and len(feed.errors) == 1
+
+def test_floor_map_shows_the_patient_in_bed_zero(tmp_path):
+    feed = WardFeed(str(tmp_path / 'events.jsonl'), physical_beds=4)
+    feed.apply({'event': 'admit', 'bed': 0, 'cat': 2, 'days_remaining': 3})
+    feed.apply({'event': 'admit', 'bed': 3, 'cat': 4, 'days_remaining': 6})
+    html = _floor_map_html(feed.ward(), total_capacity=4, physical_beds=4)
+    assert '<small>BED 1</small><br><b>C2</b>' in html
+    assert '<small>BED 4</small><br><b>C4</b>' in html
+    assert html.count('OPEN') == 2
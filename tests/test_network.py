@@ -0,0 +1,27 @@
+from bench import REFERENCE
+from network import run_network
+
+def _totals(sites, **kwargs):
+    df = run_network(REFERENCE, sites, seed=0, **kwargs)
+    return df.groupby('site')[['transfers_in', 'transfers_out', 'occupancy']].sum()
+
+def test_unit_without_beds_sends_its_list_to_an_idle_sibling():
+    sites = [dict(name='closed', total_beds=0, surg_per_week=8, weekly_refs=8, total_backlog=200),
+             dict(name='idle', total_beds=30, surg_per_week=10, weekly_refs=2, total_backlog=10)]
+    totals = _totals(sites)
+    assert totals.loc['closed', 'transfers_out'] > 0
+    assert totals.loc['closed', 'transfers_out'] == totals.loc['idle', 'transfers_in']
+    assert totals.loc['closed', 'occupancy'] == 0
+
+def test_busy_sibling_with_free_beds_still_receives():
+    # The receiver fills every theater slot with its own list but has beds left over
+    sites = [dict(name='short', total_beds=4, surg_per_week=8, weekly_refs=8, total_backlog=200),
+             dict(name='roomy', total_beds=40, surg_per_week=6, weekly_refs=8, total_backlog=200)]
+    totals = _totals(sites, routing='pooled')
+    assert totals.loc['roomy', 'transfers_in'] > 0
+
+def test_overflow_stays_within_a_region():
+    sites = [dict(name='closed', total_beds=0, surg_per_week=8, weekly_refs=8, total_backlog=200, region='north'),
+             dict(name='idle', total_beds=30, surg_per_week=10, weekly_refs=2, total_backlog=10, region='south')]
+    totals = _totals(sites)
+    assert totals['transfers_in'].sum() == totals['transfers_out'].sum() == 0
@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+from bench import REFERENCE
+from engine import BATCH_COLUMNS, batch_arrays
+from rare import breach_probability
+
+PLAN = {**REFERENCE, 'surg_per_week': 9, 'total_beds': 15}  # p is a few percent
+
+def test_window_must_fit_before_horizon():
+    with pytest.raises(ValueError):
+        breach_probability(PLAN, weeks=52, start_week=51)
+
+def test_splitting_agrees_with_plain_monte_carlo():
+    out = batch_arrays(PLAN, [], weeks=52, n_reps=20_000, seed=1)
+    hit = (out[26:, :, BATCH_COLUMNS.index('Over_26_Wks')] > 0).any(axis=0)
+    mc, mc_se = hit.mean(), hit.std() / np.sqrt(len(hit))
+
+    est = breach_probability(PLAN, start_week=26, n_particles=200, n_repeats=20, seed=0, mc_reps=64)
+    assert abs(est.probability - mc) < 3 * np.hypot(est.std_error, mc_se)
+    assert est.weeks_simulated > 0 and est.mc_seconds_per_run > 0
@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+from service import ServiceBusy, SimulationService
+
+def _blocking(started, proceed):
+    def fn(job):
+        started.set()
+        proceed.wait(5)
+        return 'done'
+    return fn
+
+def test_released_running_job_still_counts_against_heavy_limit():
+    service = SimulationService(max_workers=2, max_heavy=1)
+    started, proceed = threading.Event(), threading.Event()
+    job = service.acquire('stress', 'a', _blocking(started, proceed), heavy=True)
+    assert started.wait(5)
+    service.release(job)
+    assert job.cancel_event.is_set()
+    assert not service.has_room(heavy=True)
+    with pytest.raises(ServiceBusy):
+        service.acquire('stress', 'a', _blocking(threading.Event(), proceed), heavy=True)
+
+    proceed.set()
+    job.future.result(5)
+    assert service.has_room(heavy=True)
+    assert service.load()['draining'] == 0
+
+def test_released_queued_job_frees_its_place_at_once():
+    service = SimulationService(max_workers=1, max_heavy=2)
+    started, proceed = threading.Event(), threading.Event()
+    running = service.acquire('stress', 'a', _blocking(started, proceed), heavy=True)
+    assert started.wait(5)
+    queued = service.acquire('stress', 'b', _blocking(threading.Event(), proceed), heavy=True)
+    service.release(queued)
+    assert queued.future.cancelled()
+    assert service.load()['in_flight'] == 1
+    proceed.set()
+    running.future.result(5)
@@ -9,9 +9,137 @@ COLOR_MAP = {
     'Cat 1': '#D32F2F', 'Cat 2': '#F57C00', 'Cat 3': '#FBC02D', 
     'Cat 4': '#1976D2', 'Cat 5': '#388E3C', 'Empty': '#E0E0E0'
 }
+CATS = ['Cat 1', 'Cat 2', 'Cat 3', 'Cat 4', 'Cat 5']
 
-def render_executive_kpis(df_base, df_prop, df_ai):
-    """High-level metric comparison for the C-Suite."""
+# A chart a third of the page wide has fewer pixels than this; more points only cost serialization
+MAX_POINTS = 400
+SAMPLE_SEED = 7
+
+def downsample(df, max_points=MAX_POINTS):
+    """Every k-th row of a per-period frame so at most max_points remain, always keeping the last."""
+    step = -(-len(df) // max_points)
+    if step <= 1:
+        return df
+    idx = np.r_[np.arange(0, len(df) - 1, step), len(df) - 1]
+    return df.iloc[idx]
+
+# --- Figure builders: cached on their (already downsampled) inputs, so an unchanged rerun skips plotly.
+# cache_resource hands back the one shared Figure instead of unpickling (and so re-validating) a copy;
+# st.plotly_chart only reads it, and nothing here changes a figure once it is built ---
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _strategy_figure(df, show_legend):
+    fig = px.area(df, x='week', y=CATS, color_discrete_map=COLOR_MAP, height=400)
+    fig.add_scatter(x=df['week'], y=df['Over_26_Wks'],
+                    name="Legacy Risk (>26w)", line=dict(color='white', dash='dot', width=2))
+    fig.update_layout(showlegend=show_legend, margin=dict(l=10, r=10, t=30, b=10), template="plotly_white")
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _referral_figure(weekly_refs):
+    data = np.random.default_rng(SAMPLE_SEED).poisson(weekly_refs, 1000)
+    fig = px.histogram(data, nbins=15, color_discrete_sequence=['#1E3A8A'])
+    fig.update_layout(title="Variation in Weekly Referrals", xaxis_title="New Patients", yaxis_title="Frequency")
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _los_figure(los_means, los_scale, n=120):
+    # All five categories in one gamma draw; the frame is built column-wise rather than per patient
+    stays = np.random.default_rng(SAMPLE_SEED).gamma(np.repeat(los_means, n), los_scale)
+    cat_no = np.repeat(np.arange(1, 6), n)
+    # We label Cat 1/2 as 'High Acuity' to emphasize bed-blocking risk
+    df_stays = pd.DataFrame({"Category": np.array(CATS)[cat_no - 1], "Days": stays,
+                             "Type": np.where(cat_no <= 2, "High Acuity", "Standard")})
+    fig = px.box(df_stays, x="Category", y="Days", color="Category",
+                 color_discrete_map=COLOR_MAP, points=False,
+                 hover_data=["Type"])
+    fig.update_layout(
+        showlegend=False,
+        height=350,
+        margin=dict(t=10, b=10),
+        yaxis_title="Bed Days (LOS)"
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _det_cluster_figure(avg_det):
+    data = np.random.default_rng(SAMPLE_SEED).poisson(avg_det, 1000)
+    fig = px.histogram(data, nbins=15, color_discrete_sequence=['#D32F2F'])
+    fig.update_layout(
+        title=f"Frequency of 'Crisis Weeks' (Avg: {avg_det:.1f}/wk)",
+        xaxis_title="Patients Deteriorating in One Week",
+        yaxis_title="Frequency (Simulated Weeks)",
+        bargap=0.1, height=350
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _cloud_figure(stats):
+    week = stats['week'].to_numpy()
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=np.r_[week, week[::-1]],
+        y=np.r_[stats['Over_26_Wks_p95'].to_numpy(), stats['Over_26_Wks_p5'].to_numpy()[::-1]],
+        fill='toself', fillcolor='rgba(30, 58, 138, 0.1)',
+        line=dict(color='rgba(255,255,255,0)'), name='Uncertainty Range (5th-95th)'
+    ))
+    fig.add_trace(go.Scatter(x=week, y=stats['Over_26_Wks_mean'],
+                             line=dict(color='#1E3A8A', width=3), name='Expected Outcome'))
+    fig.add_trace(go.Scatter(x=week, y=stats['Over_26_Wks_breach'] * 100, yaxis='y2',
+                             line=dict(color='#D32F2F', width=1, dash='dot'), name='Breach Probability (%)'))
+
+    fig.update_layout(title="Legacy Risk Stabilization Horizon",
+                      xaxis_title="Weeks into Future", yaxis_title="Patients in Legacy Breach",
+                      yaxis2=dict(title="Breach Probability (%)", overlaying='y', side='right', range=[0, 100]),
+                      template="plotly_white")
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _sensitivity_figure(indices, n_designs):
+    df = indices.copy()
+    df['direction'] = np.where(df['spearman'] >= 0, 'Raises it', 'Lowers it')
+    fig = px.bar(df, x='first_order', y='parameter', orientation='h', color='direction',
+                 color_discrete_map={'Raises it': '#D32F2F', 'Lowers it': '#388E3C'})
+    fig.update_layout(title=f"Share of Variance Explained ({n_designs:,} Scenarios)",
+                      xaxis_title="First-Order Sensitivity Index", yaxis_title="",
+                      yaxis=dict(autorange='reversed'), template="plotly_white", height=420)
+    return fig
+
+# Floor map tiles: (background, text colour, border, extra style) for each bed state
+BED_STYLES = {
+    'open': ('#eee', '#aaa', '1px dashed #ccc', ''),
+    'closed': ('#f9f9f9', '#ccc', '1px solid #eee', 'filter: grayscale(100%);'),
+    'extra': ('#FFF3E0', '#E65100', '2px solid #FFB74D', ''),
+}
+
+def _floor_map_html(ward_state, total_capacity, physical_beds):
+    """The whole floor map as one CSS grid, so Streamlit gets a single element however many beds."""
+    # Patients fill the first beds in order, unless they carry their own bed number (0-based, as in feed.py)
+    by_bed = {p.get('bed', i): p for i, p in enumerate(ward_state)}
+    tiles = []
+    for i in range(max(physical_beds, total_capacity, max(by_bed, default=-1) + 1)):
+        # CASE 1: Bed is occupied by a patient
+        if i in by_bed:
+            p = by_bed[i]
+            color = COLOR_MAP.get(f"Cat {p['cat']}", '#E0E0E0')
+            tiles.append(f'<div style="background-color:{color}; color:white; border:2px solid white; '
+                         f'box-shadow: 2px 2px 5px rgba(0,0,0,0.1);">'
+                         f"<small>BED {i+1}</small><br><b>C{p['cat']}</b><br><small>{int(p['days_remaining'])}d left</small></div>")
+            continue
+        # CASE 2: Bed is "Active" (Open) but empty; CASE 3: Bed exists physically but is "Closed"
+        # (Unfunded/Unstaffed); CASE 4: Extra beds needed beyond physical footprint
+        state = 'open' if i < total_capacity else 'closed' if i < physical_beds else 'extra'
+        bg, fg, border, extra = BED_STYLES[state]
+        label = '<b style="color:#388E3C;">OPEN</b>' if state == 'open' else f'<b>{state.upper()}</b>'
+        tiles.append(f'<div style="background-color:{bg}; color:{fg}; border:{border}; {extra}">'
+                     f'<small>BED {i+1}</small><br><br>{label}</div>')
+    # 5 columns looks cleaner for 10+ beds
+    return ('<style>.floor-map{display:grid; grid-template-columns:repeat(5, 1fr); gap:8px;}'
+            '.floor-map > div{padding:10px; border-radius:5px; text-align:center; height:100px;}</style>'
+            '<div class="floor-map">' + ''.join(tiles) + '</div>')
+
+def render_executive_kpis(df_base, df_prop, df_ai, estimated=()):
+    """High-level metric comparison for the C-Suite; `estimated` names scenarios still showing the fluid estimate."""
     st.markdown("### 📊 Strategic KPI Comparison")
     c1, c2, c3 = st.columns(3)
     
@@ -22,29 +150,35 @@ def render_executive_kpis(df_base, df_prop, df_ai):
     ]
     
     for i, (name, df) in enumerate(scenarios):
-        total_cancels = int(df['cancellations'].sum())
-        risk_end = int(df.iloc[-1]['Over_26_Wks'])
+        if df is None:
+            # Still computing in the background; the page reruns once it lands
+            with [c1, c2, c3][i]:
+                st.metric(f"{name} Stability", "⏳ Pending")
+            continue
+        total_cancels = int(round(df['cancellations'].sum()))
+        risk_end = int(round(df.iloc[-1]['Over_26_Wks']))
         status = "✅ STABLE" if risk_end == 0 else "⚠️ RISK"
         
         with [c1, c2, c3][i]:
             st.metric(f"{name} Stability", status)
             st.metric("Annual Cancellations", total_cancels)
             st.metric("Year-End Legacy Risk", f"{risk_end} Patients")
+            if name in estimated:
+                st.caption("⚡ Instant estimate; simulation confirming...")
 
 def render_triple_charts(df_c, df_p, df_ai, titles, key=None):
     """The core side-by-side strategy view."""
     st.divider()
     data = [df_c, df_p, df_ai]
     cols = st.columns(3)
-    cats = ['Cat 1', 'Cat 2', 'Cat 3', 'Cat 4', 'Cat 5']
-    
+
     for i, col in enumerate(cols):
         with col:
             st.markdown(f"#### {titles[i]}")
-            fig = px.area(data[i], x='week', y=cats, color_discrete_map=COLOR_MAP, height=400)
-            fig.add_scatter(x=data[i]['week'], y=data[i]['Over_26_Wks'], 
-                            name="Legacy Risk (>26w)", line=dict(color='white', dash='dot', width=2))
-            fig.update_layout(showlegend=(i==2), margin=dict(l=10, r=10, t=30, b=10), template="plotly_white")
+            if data[i] is None:
+                st.info("⏳ Simulating...")
+                continue
+            fig = _strategy_figure(downsample(data[i][['week'] + CATS + ['Over_26_Wks']]), i == 2)
             st.plotly_chart(fig, use_container_width=True, key=f"{key}_{i}")
 
 def render_ward_ops(week_data, total_capacity):
@@ -55,58 +189,24 @@ def render_ward_ops(week_data, total_capacity):
     with c1:
         st.subheader("📋 Weekly Prescription")
         adms = week_data.get('admissions', {})
-        for cat in ['Cat 1', 'Cat 2', 'Cat 3', 'Cat 4', 'Cat 5']:
-            count = adms.get(cat, 0)
-            st.markdown(f"""
-                <div style="background-color:{COLOR_MAP[cat]}; padding:10px; border-radius:5px; color:white; margin-bottom:5px;">
-                <b>{cat}:</b> {count} Admissions scheduled
-                </div>""", unsafe_allow_html=True)
-                
+        st.markdown(''.join(f"""
+            <div style="background-color:{COLOR_MAP[cat]}; padding:10px; border-radius:5px; color:white; margin-bottom:5px;">
+            <b>{cat}:</b> {adms.get(cat, 0)} Admissions scheduled
+            </div>""" for cat in CATS), unsafe_allow_html=True)
+
     with c2:
         # We assume 10 is the physical baseline of the unit
         PHYSICAL_BEDS = 10
-        display_beds = max(PHYSICAL_BEDS, total_capacity)
-        
+
         st.subheader(f"🛌 Floor Map View ({total_capacity} Active Beds)")
         ward_state = week_data.get('ward_state', [])
-        
+
         # High Acuity Warning
-        high_acuity = len([p for p in ward_state if p.get('cat', 5) <= 2])
+        high_acuity = sum(p.get('cat', 5) <= 2 for p in ward_state)
         if high_acuity > (total_capacity * 0.6):
             st.warning(f"🚨 **High Acuity Alert:** {high_acuity} beds are Cat 1/2. Staffing ratio 1:1 required.")
-            
-        cols = st.columns(5) # 5 columns looks cleaner for 10+ beds
-        for i in range(display_beds):
-            with cols[i % 5]:
-                # CASE 1: Bed is occupied by a patient
-                if i < len(ward_state):
-                    p = ward_state[i]
-                    color = COLOR_MAP.get(f"Cat {p['cat']}", '#E0E0E0')
-                    st.markdown(f"""
-                        <div style="background-color:{color}; padding:10px; border-radius:5px; color:white; text-align:center; border:2px solid white; height:100px; box-shadow: 2px 2px 5px rgba(0,0,0,0.1);">
-                        <small>BED {i+1}</small><br><b>C{p['cat']}</b><br><small>{int(p['days_remaining'])}d left</small>
-                        </div>""", unsafe_allow_html=True)
-                
-                # CASE 2: Bed is "Active" (Open) but empty
-                elif i < total_capacity:
-                    st.markdown(f"""
-                        <div style="background-color:#eee; padding:10px; border-radius:5px; color:#aaa; text-align:center; border:1px dashed #ccc; height:100px;">
-                        <small>BED {i+1}</small><br><br><b style="color:#388E3C;">OPEN</b>
-                        </div>""", unsafe_allow_html=True)
-                
-                # CASE 3: Bed exists physically but is "Closed" (Unfunded/Unstaffed)
-                elif i < PHYSICAL_BEDS:
-                    st.markdown(f"""
-                        <div style="background-color:#f9f9f9; padding:10px; border-radius:5px; color:#ccc; text-align:center; border:1px solid #eee; height:100px; filter: grayscale(100%);">
-                        <small>BED {i+1}</small><br><br><b>CLOSED</b>
-                        </div>""", unsafe_allow_html=True)
-                
-                # CASE 4: Extra beds needed beyond physical footprint
-                else:
-                    st.markdown(f"""
-                        <div style="background-color:#FFF3E0; padding:10px; border-radius:5px; color:#E65100; text-align:center; border:2px solid #FFB74D; height:100px;">
-                        <small>BED {i+1}</small><br><br><b>EXTRA</b>
-                        </div>""", unsafe_allow_html=True)
+
+        st.markdown(_floor_map_html(ward_state, total_capacity, PHYSICAL_BEDS), unsafe_allow_html=True)
 
 def render_variance_analysis(params):
     """Transparency Tab: Comprehensive view of clinical and operational distributions."""
@@ -116,9 +216,7 @@ def render_variance_analysis(params):
     
     with col1:
         st.subheader("A) Referral Volatility (Poisson)")
-        data = np.random.poisson(params['weekly_refs'], 1000)
-        fig = px.histogram(data, nbins=15, color_discrete_sequence=['#1E3A8A'])
-        fig.update_layout(title="Variation in Weekly Referrals", xaxis_title="New Patients", yaxis_title="Frequency")
+        fig = _referral_figure(params['weekly_refs'])
         st.plotly_chart(fig, use_container_width=True)
         st.caption("Simulates 'Lumpy' demand—planning for the average, but prepared for surges.")
 
@@ -126,31 +224,8 @@ def render_variance_analysis(params):
         st.subheader("B) LOS Confidence Map")
         st.markdown("Typical Stay vs. **Outlier Bed-Blocking Risk**.")
         
-        all_stays = []
-        
-        for i in range(1, 6):
-            m = params.get(f'los_cat{i}', 5)
-
-            # Standard Patient Distribution
-            stays = np.random.gamma(shape=m, scale=params.get('los_scale', 1.0), size=120)
-
-            for s in stays:
-                # We label Cat 1/2 as 'High Acuity' to emphasize bed-blocking risk
-                acuity_type = "High Acuity" if i <= 2 else "Standard"
-                all_stays.append({"Category": f"Cat {i}", "Days": s, "Type": acuity_type})
-            
-                
-        df_stays = pd.DataFrame(all_stays)
-        fig = px.box(df_stays, x="Category", y="Days", color="Category", 
-                     color_discrete_map=COLOR_MAP, points=False,
-                     hover_data=["Type"])
-
-        fig.update_layout(
-            showlegend=False, 
-            height=350, 
-            margin=dict(t=10, b=10),
-            yaxis_title="Bed Days (LOS)"
-        )
+        los_means = tuple(params.get(f'los_cat{i}', 5) for i in range(1, 6))
+        fig = _los_figure(los_means, params.get('los_scale', 1.0))
         st.plotly_chart(fig, use_container_width=True)
         st.caption("Boxes show the 25th-75th percentile; whiskers capture the clinical outliers.")
 
@@ -183,15 +258,7 @@ def render_variance_analysis(params):
         st.subheader("D) Deterioration Clusters")
         # Logic for showing how often multiple patients get sicker at once
         avg_det = params.get('det_events_mean', 4.2) 
-        data = np.random.poisson(avg_det, 1000)
-        
-        fig = px.histogram(data, nbins=15, color_discrete_sequence=['#D32F2F'])
-        fig.update_layout(
-            title=f"Frequency of 'Crisis Weeks' (Avg: {avg_det:.1f}/wk)",
-            xaxis_title="Patients Deteriorating in One Week",
-            yaxis_title="Frequency (Simulated Weeks)",
-            bargap=0.1, height=350
-        )
+        fig = _det_cluster_figure(round(float(avg_det), 2))
         st.plotly_chart(fig, use_container_width=True)
         st.info("""
         **Executive Insight: The 'Volatility' Buffer**
@@ -200,22 +267,38 @@ def render_variance_analysis(params):
         * **Impact:** In these weeks, multiple patients jump to higher clinical priority (Cat 1/2). This forces the system to 'queue-jump' these patients into surgery, causing cancellations for lower-priority cases and requiring a pre-planned bed buffer.
         """)
 
-def render_monte_carlo_cloud(df_mc):
-    """Stress test visualization with uncertainty bands."""
+def render_monte_carlo_cloud(stats):
+    """Stress test visualization with uncertainty bands, from a StreamingSummary frame."""
     st.header("🚀 Stress Test: 52-Week Projection")
-    stats = df_mc.groupby('week')['Over_26_Wks'].agg(['mean', 'min', 'max']).reset_index()
     
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=pd.concat([stats['week'], stats['week'][::-1]]),
-        y=pd.concat([stats['max'], stats['min'][::-1]]),
-        fill='toself', fillcolor='rgba(30, 58, 138, 0.1)',
-        line=dict(color='rgba(255,255,255,0)'), name='Uncertainty Range'
-    ))
-    fig.add_trace(go.Scatter(x=stats['week'], y=stats['mean'], 
-                             line=dict(color='#1E3A8A', width=3), name='Expected Outcome'))
-    
-    fig.update_layout(title="Legacy Risk Stabilization Horizon", 
-                      xaxis_title="Weeks into Future", yaxis_title="Patients in Legacy Breach",
-                      template="plotly_white")
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    fig = _cloud_figure(downsample(stats))
+    st.plotly_chart(fig, use_container_width=True)
+
+def render_performance_profile(profile, key=None):
+    """Performance Tab: where one engine run spent its time, phase by phase."""
+    st.header("⏱️ Engine Performance Profile")
+    df = profile.to_frame()
+    total_ms = df['ms'].sum()
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Engine Time", f"{total_ms:.1f} ms")
+    col2.metric("Cost per Simulated Week", f"{total_ms * 1e3 / max(profile.weeks, 1):.0f} µs")
+    col3.metric("Dominant Phase", df.loc[df['ms'].idxmax(), 'phase'].replace('_', ' ').title())
+
+    fig = px.bar(df, x='ms', y='phase', orientation='h', text=df['share'].map('{:.0%}'.format),
+                 color_discrete_sequence=['#1E3A8A'])
+    fig.update_layout(title="Time by Weekly Phase", xaxis_title="Milliseconds", yaxis_title="",
+                      yaxis=dict(autorange='reversed'), template="plotly_white")
+    st.plotly_chart(fig, use_container_width=True, key=key)
+
+    st.subheader("Work Counters")
+    counters = pd.DataFrame({'Counter': [k.replace('_', ' ').capitalize() for k in profile.counters],
+                             'Value': list(profile.counters.values())})
+    st.dataframe(counters, hide_index=True, use_container_width=True)
+
+def render_sensitivity(indices, metric_label, key=None):
+    """Transparency Tab: global sensitivity of an outcome to every swept clinical input."""
+    st.subheader(f"E) What Drives {metric_label}?")
+    fig = _sensitivity_figure(indices, indices.attrs['n_designs'])
+    st.plotly_chart(fig, use_container_width=True, key=key)
+    st.caption("Each bar is the share of the outcome's variation explained by that input alone across a Latin hypercube of scenarios.")